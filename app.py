@@ -18,6 +18,14 @@ logging.basicConfig(
 # Import the agent core
 from src.agent_core import process_query
 from src.config import SUPPORTED_BANKS
+from src.smart_router import warm_caches
+
+
+@st.cache_resource
+def _warm_router_caches():
+    """Prime the router's bank/category lists once per server process, not per rerun"""
+    warm_caches()
+    return True
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -27,6 +35,8 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+_warm_router_caches()
+
 # --- Custom CSS for Professional Look (Dark/Light Mode Compatible) ---
 st.markdown("""
 <style>
@@ -279,7 +289,15 @@ if prompt := st.chat_input("💬 Ask me anything about banking products, loans,
     with st.chat_message("assistant", avatar="🤖"):
         with st.spinner("🤔 Analyzing your question..."):
             try:
-                response_obj = process_query(prompt, chat_history=st.session_state.messages, mode="auto")
+                # Stream LLM-formatted answers into a placeholder as tokens arrive
+                answer_box = st.empty()
+                streamed = []
+                
+                def show_delta(delta):
+                    streamed.append(delta)
+                    answer_box.markdown("".join(streamed) + "▌")
+                
+                response_obj = process_query(prompt, chat_history=st.session_state.messages, mode="auto", on_delta=show_delta)
                 
                 if isinstance(response_obj, dict):
                     ans = response_obj.get("text", "I apologize, but I couldn't generate a response.")
@@ -287,8 +305,8 @@ if prompt := st.chat_input("💬 Ask me anything about banking products, loans,
                     data = response_obj.get("data")
                     metadata = response_obj.get("metadata", {})
                     
-                    # Display answer
-                    st.markdown(ans)
+                    # Display answer (replaces the streamed draft, incl. any validation notes)
+                    answer_box.markdown(ans)
                     
                     # Show sources
                     if metadata and metadata.get('sources_searched'):
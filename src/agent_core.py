@@ -11,6 +11,7 @@ Uses the smart_router for intelligent query routing:
 import logging
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -31,8 +32,11 @@ from src.smart_router import smart_route  # Direct import of smart router
 client = OpenAI(api_key=OPENAI_API_KEY)
 retriever = MultiSourceRetriever()
 
+# Independent queries are network-bound (LLM calls), so they overlap well in threads
+QUERY_MAX_WORKERS = 8
 
-def process_query(user_query, user_id="guest", chat_history=None, mode="auto"):
+
+def process_query(user_query, user_id="guest", chat_history=None, mode="auto", on_delta=None, max_text_chars=None):
     """
     Main Query Orchestrator using Smart Router.
     
@@ -47,6 +51,9 @@ def process_query(user_query, user_id="guest", chat_history=None, mode="auto"):
         user_id: User identifier
         chat_history: Conversation history
         mode: Ignored (always uses smart routing)
+        on_delta: Optional callback for streamed text chunks (COUNT/EXPLAIN LLM formatting)
+        max_text_chars: Optional cap on the ChatGPT-mode answer (FAQ/COMPARE/RECOMMEND/fallback);
+            generation stops early once reached, for callers that only read a prefix
     
     Returns:
         Response dict with text, source, data, metadata
@@ -145,7 +152,7 @@ def process_query(user_query, user_id="guest", chat_history=None, mode="auto"):
     # COUNT - Guaranteed accuracy
     if intent == 'COUNT':
         logging.info("→ ROUTING: COUNT (guaranteed accuracy)")
-        return handle_count_query(query_info)
+        return handle_count_query(query_info, on_delta=on_delta)
     
     # LIST - Guaranteed completeness
     if intent == 'LIST':
@@ -155,39 +162,65 @@ def process_query(user_query, user_id="guest", chat_history=None, mode="auto"):
     # EXPLAIN_ALL - All products with details
     if intent == 'EXPLAIN_ALL':
         logging.info("→ ROUTING: EXPLAIN_ALL (guaranteed completeness)")
-        return handle_explain_query(query_info)
+        return handle_explain_query(query_info, on_delta=on_delta)
     
     # EXPLAIN - Single product/category
     if intent == 'EXPLAIN':
         logging.info("→ ROUTING: EXPLAIN")
-        return handle_explain_query(query_info)
+        return handle_explain_query(query_info, on_delta=on_delta)
     
     # FAQ - ChatGPT with FAQ context
     if intent == 'FAQ':
         logging.info("→ ROUTING: FAQ (ChatGPT)")
-        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='FAQ')
+        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='FAQ', max_text_chars=max_text_chars)
     
     # COMPARE
     if intent == 'COMPARE':
         logging.info("→ ROUTING: COMPARE (ChatGPT)")
-        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='COMPARE')
+        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='COMPARE', max_text_chars=max_text_chars)
     
     # RECOMMEND
     if intent == 'RECOMMEND':
         logging.info("→ ROUTING: RECOMMEND (ChatGPT)")
-        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='RECOMMEND')
+        return chatgpt_query(effective_query, chat_history, clarification_mode=False, intent='RECOMMEND', max_text_chars=max_text_chars)
     
     # Fallback: ChatGPT
     logging.info("→ ROUTING: FALLBACK (intent=UNKNOWN)")
-    return chatgpt_query(effective_query, chat_history, clarification_mode=False)
+    return chatgpt_query(effective_query, chat_history, clarification_mode=False, max_text_chars=max_text_chars)
+
 
+def process_query_many(queries, chat_histories=None, max_workers=QUERY_MAX_WORKERS, **kwargs):
+    """
+    Run process_query for several independent queries concurrently
+    (e.g. separate sessions or a test sweep).
+    
+    Args:
+        queries: User questions
+        chat_histories: Optional history per query (None = no history)
+        max_workers: Upper bound on concurrent queries
+        **kwargs: Passed through to every process_query call
+    
+    Returns:
+        One response dict per query, in input order
+    """
+    if not queries:
+        return []
+    if chat_histories is None:
+        chat_histories = [None] * len(queries)
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+        futures = [
+            executor.submit(process_query, query, chat_history=chat_history, **kwargs)
+            for query, chat_history in zip(queries, chat_histories)
+        ]
+        return [future.result() for future in futures]
 
 
 # =============================================================================
 # ACCURACY-CRITICAL HANDLERS
 # =============================================================================
 
-def handle_count_query(query_info: dict) -> dict:
+def handle_count_query(query_info: dict, on_delta=None) -> dict:
     """
     Handle COUNT queries with guaranteed accuracy.
     Uses pure Python counting (no LLM hallucination).
@@ -200,7 +233,7 @@ def handle_count_query(query_info: dict) -> dict:
     logging.info(f"[COUNT Handler] Bank={bank}, Category={category}")
     
     products = retriever.get_all_products(bank=bank, category=category)
-    return format_count_response(products, query_info)
+    return format_count_response(products, query_info, on_delta=on_delta)
 
 
 def handle_list_query(query_info: dict) -> dict:
@@ -222,7 +255,7 @@ def handle_list_query(query_info: dict) -> dict:
     return format_list_response(products, query_info, detailed=detailed)
 
 
-def handle_explain_query(query_info: dict) -> dict:
+def handle_explain_query(query_info: dict, on_delta=None) -> dict:
     """
     Handle EXPLAIN/EXPLAIN_ALL queries with controlled LLM.
     Uses LLM with strict validation to ensure all products are explained.
@@ -241,7 +274,7 @@ def handle_explain_query(query_info: dict) -> dict:
     else:
         products = retriever.get_all_products(bank=bank, category=category)
     
-    return format_explain_response(products, query_info, client)
+    return format_explain_response(products, query_info, client, on_delta=on_delta)
 
 
 # =============================================================================
@@ -261,10 +294,18 @@ def handle_multi_operation(query_info: dict, effective_query: str, chat_history:
     
     logging.info(f"[Multi-Op] Executing {len(operations)} operations: {operations}")
     
+    # COUNT + EXPLAIN over the same scope share one LLM call
+    combined = {}
+    if 'COUNT' in operations and ('EXPLAIN' in operations or 'EXPLAIN_ALL' in operations) \
+            and not query_info.get('product_name'):
+        from src.response_formatters import format_count_and_explain
+        products = retriever.get_all_products(bank=query_info.get('bank'), category=query_info.get('category'))
+        combined = format_count_and_explain(products, query_info)
+    
     for op in operations:
         try:
             if op == 'COUNT':
-                result = handle_count_query(query_info)
+                result = combined.get('COUNT') or handle_count_query(query_info)
                 results.append(result['text'])
                 logging.info(f"[Multi-Op] ✅ COUNT executed")
             
@@ -274,7 +315,7 @@ def handle_multi_operation(query_info: dict, effective_query: str, chat_history:
                 logging.info(f"[Multi-Op] ✅ LIST executed")
             
             elif op == 'EXPLAIN' or op == 'EXPLAIN_ALL':
-                result = handle_explain_query(query_info)
+                result = combined.get('EXPLAIN') or handle_explain_query(query_info)
                 results.append(result['text'])
                 logging.info(f"[Multi-Op] ✅ EXPLAIN executed")
             
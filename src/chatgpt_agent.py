@@ -7,7 +7,7 @@ Used for general questions, follow-ups, and exploratory conversations.
 
 import logging
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from openai import OpenAI
 from src.config import OPENAI_API_KEY, LLM_MODEL, get_banks_short, SUPPORTED_BANKS
@@ -20,7 +20,39 @@ MAX_RETRIEVAL_RESULTS = 30  # Configurable: max results to retrieve
 client = OpenAI(api_key=OPENAI_API_KEY)
 retriever = MultiSourceRetriever()
 
-def chatgpt_query(user_query: str, chat_history: Optional[List[Dict]] = None, clarification_mode: bool = False, intent: Optional[str] = None, suppress_count: bool = False) -> Dict[str, Any]:
+def _stream_until(messages: List[Dict], max_text_chars: int) -> Tuple[str, bool]:
+    """
+    Stream a completion and stop reading once max_text_chars characters arrived.
+    
+    Returns (text, truncated). Closing the stream early ends generation server-side,
+    so callers that only need a prefix don't wait for (or pay for) the rest.
+    """
+    parts = []
+    length = 0
+    stream = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        temperature=0.7,
+        max_tokens=2000,
+        timeout=30,
+        stream=True
+    )
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                length += len(delta)
+                if length >= max_text_chars:
+                    return "".join(parts)[:max_text_chars], True
+    finally:
+        stream.close()
+    return "".join(parts), False
+
+
+def chatgpt_query(user_query: str, chat_history: Optional[List[Dict]] = None, clarification_mode: bool = False, intent: Optional[str] = None, suppress_count: bool = False, max_text_chars: Optional[int] = None) -> Dict[str, Any]:
     """
     ChatGPT-style conversational query handler.
     
@@ -33,6 +65,8 @@ def chatgpt_query(user_query: str, chat_history: Optional[List[Dict]] = None, cl
         clarification_mode: If True, focus on asking clarifying questions for vague queries
         intent: The detected intent (FAQ, RECOMMEND, COMPARE, etc.) for metadata
         suppress_count: If True, instruct LLM NOT to count products (used in multi-op when COUNT already handled)
+        max_text_chars: If set, the answer is streamed and generation stops after this many
+            characters (metadata['text_truncated'] reports whether it was cut)
         
     Returns:
         Response dict with text, source, data, metadata
@@ -224,15 +258,18 @@ Be brief and redirect without suggestions.
     
     # 4. Get LLM response with robust error handling
     try:
-        response = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=messages,
-            temperature=0.7,  # More conversational than structured mode
-            max_tokens=2000,
-            timeout=30  # 30 second timeout
-        )
-        
-        response_text = response.choices[0].message.content
+        if max_text_chars:
+            response_text, metadata['text_truncated'] = _stream_until(messages, max_text_chars)
+        else:
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=0.7,  # More conversational than structured mode
+                max_tokens=2000,
+                timeout=30  # 30 second timeout
+            )
+            
+            response_text = response.choices[0].message.content
         
         # Extract structured data for follow-ups
         if intent == 'RECOMMEND':
@@ -1,4 +1,6 @@
 import os
+import re
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -28,6 +30,12 @@ if "llama" in env_model.lower():
 else:
     LLM_MODEL = env_model
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# "sentence-transformers" (default, PyTorch), "onnx" (onnxruntime MiniLM, lighter/faster on CPU)
+# or "onnx-int8" (same with int8-quantized weights, roughly half the latency and memory)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower()
+
+# Set to "false" to classify SQL detail level with keyword rules only (no LLM fallback)
+DETAIL_LEVEL_LLM_FALLBACK = os.getenv("DETAIL_LEVEL_LLM_FALLBACK", "true").lower() != "false"
 
 # --- Constants ---
 # You can add other constants here (e.g., Collection Names)
@@ -36,13 +44,25 @@ CHROMA_COLLECTION_NAME = "bank_faqs"
 # --- Banking Configuration ---
 # Dynamic configuration - queries database for actual banks/categories
 
+def _read_distinct(column):
+    """
+    Distinct non-null values of a products column, read through a read-only
+    connection so importing config never creates (or migrates) the DB file.
+    """
+    import sqlite3
+    connection = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True)
+    try:
+        result = connection.execute(
+            f"SELECT DISTINCT {column} FROM products WHERE {column} IS NOT NULL ORDER BY {column}"
+        ).fetchall()
+    finally:
+        connection.close()
+    return [row[0] for row in result]
+
 def get_supported_banks_from_db():
     """Query database for all banks with products"""
     try:
-        from src.database import DatabaseManager
-        db = DatabaseManager()
-        result = db.execute_raw_query("SELECT DISTINCT bank_name FROM products WHERE bank_name IS NOT NULL ORDER BY bank_name")
-        banks = [row['bank_name'] for row in result]
+        banks = _read_distinct('bank_name')
         return banks if banks else ['SBI', 'HDFC']  # Fallback to defaults
     except:
         # Fallback if DB not initialized yet
@@ -51,10 +71,7 @@ def get_supported_banks_from_db():
 def get_product_categories_from_db():
     """Query database for all product categories"""
     try:
-        from src.database import DatabaseManager
-        db = DatabaseManager()
-        result = db.execute_raw_query("SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category")
-        categories = [row['category'] for row in result]
+        categories = _read_distinct('category')
         return categories if categories else ['Credit Card', 'Debit Card', 'Loan', 'Scheme']
     except:
         # Fallback if DB not initialized yet
@@ -107,6 +124,34 @@ def get_categories_display():
             display_cats.append(cat + 's')
     return ', '.join(display_cats)
 
+@lru_cache(maxsize=8)
+def bank_matcher(banks):
+    """
+    (bank_re, [(bank_lower, bank)]) for a tuple of bank names.
+    Shared by the router, SQL tool and history parser so they agree on what a bank
+    mention is: a whole-word match of the lowercased name. bank_re finds every
+    mention in one scan (zero-width, so multi-word names that share words can
+    each be reported).
+    """
+    pairs = [(bank.lower(), bank) for bank in banks]
+    alternatives = sorted({re.escape(bank_lower) for bank_lower, _ in pairs if bank_lower}, key=len, reverse=True)
+    bank_re = re.compile(r"(?=(?<!\w)(" + "|".join(alternatives) + r")(?!\w))") if alternatives else None
+    return bank_re, pairs
+
+def find_banks(text_lower, matcher):
+    """Banks from a bank_matcher() mentioned in lowercased text, in bank-list order"""
+    bank_re, pairs = matcher
+    if bank_re is None:
+        return []
+    mentioned = {m.group(1) for m in bank_re.finditer(text_lower)}
+    if not mentioned:
+        return []
+    found = []
+    for bank_lower, bank in pairs:
+        if bank_lower in mentioned and bank not in found:
+            found.append(bank)
+    return found
+
 if __name__ == "__main__":
     # Test paths
     print(f"BASE_DIR: {BASE_DIR}")
@@ -2,13 +2,117 @@ import sqlite3
 import json
 import os
 import logging
+import threading
+import zlib
+from contextlib import contextmanager
 from src.config import DB_PATH
 
+
+# === RECOMMENDATION FEATURES ===
+# Shared by the materialized card tables and the SQL tool's row filters
+
+def parse_attributes(raw):
+    """attributes column -> dict ({} if missing/invalid)"""
+    if isinstance(raw, dict):
+        return raw
+    try:
+        attrs = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    return attrs if isinstance(attrs, dict) else {}
+
+
+def attributes_version(raw):
+    """
+    Cheap fingerprint (CRC32) of a raw attributes JSON string, stable across processes.
+    Taken once when a row's attributes are parsed, so caches can key on
+    (product_id, attrs_version) instead of re-serializing the dict.
+    """
+    return zlib.crc32((raw or '').encode('utf-8'))
+
+
+# One bit per travel keyword; products store the OR of the keywords found in
+# their features / product_name so the travel filter is a single AND
+FEATURE_BITS = {
+    'lounge': 1,
+    'air india': 2,
+    'travel': 4,
+    'miles': 8,
+    'vistara': 16,
+    'etihad': 32,
+    'indigo': 64,
+}
+TRAVEL_MASK = 1 | 2 | 4 | 8 | 16 | 32 | 64
+
+
+def feature_mask(features, product_name):
+    """FEATURE_BITS of every keyword present in features or product_name"""
+    text = f"{features}\n{product_name}".lower()
+    mask = 0
+    for keyword, bit in FEATURE_BITS.items():
+        if keyword in text:
+            mask |= bit
+    return mask
+
+
+def fee_number(fees):
+    """Digits of the base fee (before any '+ GST' part) as an int, 99999 if none"""
+    digits = ''.join(filter(str.isdigit, str(fees).split('+')[0]))
+    return int(digits) if digits else 99999
+
+
+# Persona -> credit-card tables precomputed from products (see refresh_materialized_views)
+MATERIALIZED_VIEWS = {
+    'student': ('mv_student_cards', 'fees_num <= 1000'),
+    'travel': ('mv_travel_cards', 'has_travel = 1'),
+    'premium': ('mv_premium_cards', 'fees_num >= 2000'),
+}
+
+
+# Read-heavy tuning: WAL, relaxed fsync, in-memory temp tables, mmap I/O, larger page cache
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",  # 64 MB page cache, kept warm by a persistent connection
+)
+
+
+def configure_connection(connection):
+    """
+    Apply CONNECTION_PRAGMAS to a sqlite3 connection.
+    Use for any connection opened outside DatabaseManager (scripts, one-off checks)
+    so it gets the same tuning as the app's own.
+    """
+    cursor = connection.cursor()
+    for pragma in CONNECTION_PRAGMAS:
+        try:
+            cursor.execute(pragma)
+        except sqlite3.DatabaseError as e:
+            logging.warning(f"[DB] {pragma} not applied: {e}")
+
+
 class DatabaseManager:
     def __init__(self, db_path=None):
         self.db_path = str(db_path) if db_path else str(DB_PATH)
         # Quick Win 2: Persistent connection to eliminate connection overhead (~50ms per query)
-        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        # Larger statement cache so repeated (cache-hit) SQL isn't re-parsed;
+        # autocommit mode: single writes commit on their own, multi-statement
+        # writes go through transaction()
+        self._connection = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=256,
+            isolation_level=None,
+        )
+        # Rows support dict(row) / row['col'] and still index like tuples
+        self._connection.row_factory = sqlite3.Row
+        # The connection is shared across threads: one writer at a time, so a
+        # transaction opened by one thread can't be committed by another's write.
+        # Re-entrant so writes inside transaction() on the same thread don't block.
+        self._write_lock = threading.RLock()
+        configure_connection(self._connection)
         self._initialize_db()
     
     def __del__(self):
@@ -16,6 +120,30 @@ class DatabaseManager:
         if hasattr(self, '_connection'):
             self._connection.close()
 
+    @contextmanager
+    def transaction(self):
+        """
+        Run a group of writes as one transaction (committed on exit, rolled back on error).
+        Holds the write lock throughout; nested use joins the outer transaction.
+        
+            with db.transaction():
+                for product in products:
+                    db.upsert_product(product)
+        """
+        with self._write_lock:
+            if self._connection.in_transaction:
+                yield self._connection
+                return
+            self._connection.execute("BEGIN")
+            try:
+                yield self._connection
+            except BaseException:
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                raise
+            else:
+                self._connection.execute("COMMIT")
+
     def _initialize_db(self):
         """Initializes the Tables. Translates our schema.sql to SQLite syntax."""
         cursor = self._connection.cursor()
@@ -33,10 +161,23 @@ class DatabaseManager:
                 attributes TEXT, -- Stored as JSON String
                 summary_text TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                feature_mask INTEGER DEFAULT 0, -- FEATURE_BITS of features/product_name
                 UNIQUE(bank_name, product_name)
             )
         """)
         
+        # Databases created before feature_mask existed: add and backfill it
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(products)")}
+        if 'feature_mask' not in columns:
+            with self.transaction():
+                cursor.execute("ALTER TABLE products ADD COLUMN feature_mask INTEGER DEFAULT 0")
+                masks = [
+                    (feature_mask(parse_attributes(row['attributes']).get('features', ''), row['product_name']), row['product_id'])
+                    for row in cursor.execute("SELECT product_id, product_name, attributes FROM products").fetchall()
+                ]
+                cursor.executemany("UPDATE products SET feature_mask = ? WHERE product_id = ?", masks)
+            logging.info(f"✅ Backfilled feature_mask for {len(masks)} products")
+        
         # 2. Interaction Logs
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS interaction_logs (
@@ -53,7 +194,14 @@ class DatabaseManager:
         # Quick Win 3: Create indexes for query performance (~30-50ms improvement)
         self._create_indexes()
         
-        self._connection.commit()
+        # Databases ingested before the recommendation tables existed
+        existing = {
+            row[0] for row in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'mv_%'"
+            )
+        }
+        if any(table not in existing for table, _ in MATERIALIZED_VIEWS.values()):
+            self.refresh_materialized_views()
     
     def _create_indexes(self):
         """Create indexes on frequently queried columns to speed up WHERE clauses"""
@@ -79,6 +227,54 @@ class DatabaseManager:
         
         logging.info("✅ Database indexes created successfully")
 
+    def refresh_materialized_views(self):
+        """
+        Rebuild the per-persona credit-card tables (mv_student_cards, ...).
+        fees_num / has_lounge / has_travel are pre-extracted from the attributes
+        JSON so recommendation queries are a single ordered read.
+        Call after product upserts (ingestion does this once per run).
+        """
+        cursor = self._connection.cursor()
+        features = []
+        for row in cursor.execute(
+            "SELECT product_id, attributes, feature_mask FROM products WHERE category LIKE '%Credit Card%'"
+        ).fetchall():
+            attrs = parse_attributes(row['attributes'])
+            features.append((
+                row['product_id'],
+                fee_number(attrs.get('fees', '') or ''),
+                int('lounge' in str(attrs.get('features', '')).lower()),
+                int(bool((row['feature_mask'] or 0) & TRAVEL_MASK)),
+            ))
+        
+        try:
+            with self.transaction():
+                cursor.execute("DROP TABLE IF EXISTS temp.card_features")
+                cursor.execute("""
+                    CREATE TEMP TABLE card_features (
+                        product_id INTEGER PRIMARY KEY,
+                        fees_num INTEGER,
+                        has_lounge INTEGER,
+                        has_travel INTEGER
+                    )
+                """)
+                cursor.executemany("INSERT INTO temp.card_features VALUES (?, ?, ?, ?)", features)
+                
+                for table, condition in MATERIALIZED_VIEWS.values():
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                    cursor.execute(f"""
+                        CREATE TABLE {table} AS
+                        SELECT p.*, f.fees_num, f.has_lounge, f.has_travel
+                        FROM products p JOIN temp.card_features f USING (product_id)
+                        WHERE {condition}
+                    """)
+                    cursor.execute(f"CREATE INDEX idx_{table}_fees ON {table}(fees_num)")
+                
+                cursor.execute("DROP TABLE temp.card_features")
+            logging.info(f"✅ Refreshed recommendation tables ({len(features)} credit cards)")
+        except Exception as e:
+            logging.error(f"❌ DB Error refreshing recommendation tables: {e}")
+
 
     def upsert_product(self, product_data):
         """
@@ -88,26 +284,34 @@ class DatabaseManager:
         """
         cursor = self._connection.cursor()
         
-        attributes_json = json.dumps(product_data.get('attributes', {}))
+        attributes = product_data.get('attributes', {})
+        attributes_json = json.dumps(attributes)
+        mask = feature_mask(
+            attributes.get('features', '') if isinstance(attributes, dict) else '',
+            product_data.get('product_name', '')
+        )
         
         try:
-            cursor.execute("""
-                INSERT INTO products (bank_name, category, product_name, source_type, source_file, attributes, summary_text)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(bank_name, product_name) DO UPDATE SET
-                    attributes=excluded.attributes,
-                    summary_text=excluded.summary_text,
-                    source_file=excluded.source_file
-            """, (
-                product_data['bank_name'],
-                product_data['category'],
-                product_data['product_name'],
-                product_data['source_type'],
-                product_data.get('source_file'),
-                attributes_json,
-                product_data.get('summary_text')
-            ))
-            self._connection.commit()
+            # Autocommits on its own, or joins the caller's transaction()
+            with self._write_lock:
+                cursor.execute("""
+                    INSERT INTO products (bank_name, category, product_name, source_type, source_file, attributes, summary_text, feature_mask)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(bank_name, product_name) DO UPDATE SET
+                        attributes=excluded.attributes,
+                        summary_text=excluded.summary_text,
+                        source_file=excluded.source_file,
+                        feature_mask=excluded.feature_mask
+                """, (
+                    product_data['bank_name'],
+                    product_data['category'],
+                    product_data['product_name'],
+                    product_data['source_type'],
+                    product_data.get('source_file'),
+                    attributes_json,
+                    product_data.get('summary_text'),
+                    mask
+                ))
             logging.info(f"✅ Upserted: {product_data['product_name']}")
         except Exception as e:
             logging.error(f"❌ DB Error upserting {product_data.get('product_name')}: {e}")
@@ -151,7 +355,28 @@ class DatabaseManager:
         cursor.execute(query, params)
         count = cursor.fetchone()[0]
         return count
-    
+
+    def count_products_bulk(self, banks, category=None):
+        """
+        count_products for several banks in one grouped query.
+        Returns {bank_name: count}, with 0 for banks that have no products.
+        """
+        banks = list(banks)
+        if not banks:
+            return {}
+        cursor = self._connection.cursor()
+
+        query = f"SELECT bank_name, COUNT(*) FROM products WHERE bank_name IN ({', '.join('?' * len(banks))})"
+        params = list(banks)
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        query += " GROUP BY bank_name"
+
+        counts = dict.fromkeys(banks, 0)
+        counts.update(cursor.execute(query, params).fetchall())
+        return counts
+
     def execute_raw_query(self, query, params=None):
         """
         Execute a raw SQL query and return results as list of dicts
@@ -159,19 +384,10 @@ class DatabaseManager:
         """
         cursor = self._connection.cursor()
         cursor.execute(query, params or [])
-        
-        # Get column names from cursor description
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        
-        # Fetch all results
-        rows = cursor.fetchall()
-        
-        # Convert to list of dicts
-        results = []
-        for row in rows:
-            results.append(dict(zip(columns, row)))
-        
-        return results
+
+        # Rows are sqlite3.Row, so dict() maps column names directly
+        return [dict(row) for row in cursor.fetchall()]
+
 
 # Initialize DB on import
 if __name__ == "__main__":
@@ -272,7 +272,10 @@ def extract_product_with_unlimited_columns(row, column_mapping: Dict, bank_name:
                 attributes[clean_key] = str(value)
     
     core_data['attributes'] = attributes
+    # Deterministic summary from structured fields (no LLM round-trip needed)
     core_data['summary_text'] = f"{core_data['product_name']} is a {core_data['category']} from {core_data['bank_name']}."
+    if attributes.get('features'):
+        core_data['summary_text'] += f" Features: {attributes['features']}."
     core_data['source_type'] = 'csv_dynamic'
     
     return core_data
@@ -109,26 +109,28 @@ def gather_evidence(query: str, scope: ScopeResult) -> Evidence:
     Returns:
         Evidence object with DB and FAQ strength
     """
-    from src.database import DatabaseManager
-    from src.vector_db import FAQVectorDB
+    from src.multi_retriever import get_db, get_vector_db
     
-    db = DatabaseManager()
-    vector_db = FAQVectorDB()
+    # Shared instances: no new SQLite connection or Chroma client per query
+    db = get_db()
+    vector_db = get_vector_db()
     
     # Parallel execution
     with ThreadPoolExecutor(max_workers=2) as executor:
         # DB evidence: How many products exist?
         def count_products():
             try:
-                result = db.execute_raw_query(
-                    """
-                    SELECT COUNT(*) as count 
-                    FROM products 
-                    WHERE (? IS NULL OR bank_name = ?)
-                      AND (? IS NULL OR category LIKE ?)
-                    """,
-                    (scope.bank, scope.bank, scope.category, f"%{scope.category}%" if scope.category else None)
-                )
+                # Only the filters in scope: "(? IS NULL OR bank_name = ?)" can't
+                # seek idx_bank_category and scans the whole index instead
+                query = "SELECT COUNT(*) as count FROM products WHERE 1=1"
+                params = []
+                if scope.bank:
+                    query += " AND bank_name = ?"
+                    params.append(scope.bank)
+                if scope.category:
+                    query += " AND category LIKE ?"
+                    params.append(f"%{scope.category}%")
+                result = db.execute_raw_query(query, params)
                 return result[0]['count'] if result else 0
             except Exception as e:
                 logging.warning(f"[Evidence] DB count failed: {e}")
@@ -171,6 +173,41 @@ def gather_evidence(query: str, scope: ScopeResult) -> Evidence:
 # STEP C: OPERATION VALIDATION (Deterministic)
 # =============================================================================
 
+def _substring_re(keywords: List[str]) -> "re.Pattern":
+    """One compiled alternation per keyword group: a single .search() == any(kw in query)"""
+    return re.compile("|".join(re.escape(kw) for kw in keywords))
+
+
+# Operation signals in query (language hints, but not decisive)
+_COUNT_SIGNAL_RE = _substring_re(['how many', 'count', 'total', 'number of'])
+_LIST_SIGNAL_RE = _substring_re(['list', 'show', 'all', 'display', 'what are'])
+_COMPARE_SIGNAL_RE = _substring_re(['vs', 'versus', 'compare', 'difference between'])
+_RECOMMEND_SIGNAL_RE = _substring_re(['best', 'recommend', 'suggest', 'suitable'])
+_EXPLAIN_SIGNAL_RE = _substring_re(['explain', 'details', 'tell me about', 'describe'])
+
+# Non-product targets indicate FAQ queries, not product queries
+_NON_PRODUCT_RE = _substring_re([
+    'step', 'steps', 'process', 'procedure', 'way',
+    'document', 'documents', 'requirement', 'requirements', 'paper', 'papers',
+    'time', 'times', 'duration', 'period',
+    'eligibility', 'eligible', 'qualify',
+    'fee', 'fees', 'charge', 'charges', 'cost',
+    'interest', 'rate', 'rates',
+    'apply', 'application', 'applying',
+    'approval', 'approve',
+    'withdraw', 'withdrawal', 'limit'
+])
+
+_CONJUNCTION_RE = _substring_re([' and ', ' & ', ', '])
+
+# Procedural/FAQ phrasing that should skip the implicit LIST
+_PROCEDURAL_RE = _substring_re([
+    'how to', 'how do', 'how can', 'steps to', 'process to',
+    'register', 'activate', 'apply for', 'get a', 'open a',
+    'procedure', 'way to', 'method to', 'can i', 'do i need'
+])
+
+
 def validate_operations(query: str, scope: ScopeResult, evidence: Evidence) -> List[Operation]:
     """
     Determine which operations to execute based on evidence.
@@ -192,28 +229,15 @@ def validate_operations(query: str, scope: ScopeResult, evidence: Evidence) -> L
     query_lower = query.lower()
     
     # Detect operation signals in query (language hints, but not decisive)
-    has_count_signal = any(kw in query_lower for kw in ['how many', 'count', 'total', 'number of'])
-    has_list_signal = any(kw in query_lower for kw in ['list', 'show', 'all', 'display', 'what are'])
-    has_compare_signal = any(pat in query_lower for pat in ['vs', 'versus', 'compare', 'difference between'])
-    has_recommend_signal = any(kw in query_lower for kw in ['best', 'recommend', 'suggest', 'suitable'])
-    has_explain_signal = any(kw in query_lower for kw in ['explain', 'details', 'tell me about', 'describe'])
+    has_count_signal = _COUNT_SIGNAL_RE.search(query_lower) is not None
+    has_list_signal = _LIST_SIGNAL_RE.search(query_lower) is not None
+    has_compare_signal = _COMPARE_SIGNAL_RE.search(query_lower) is not None
+    has_recommend_signal = _RECOMMEND_SIGNAL_RE.search(query_lower) is not None
+    has_explain_signal = _EXPLAIN_SIGNAL_RE.search(query_lower) is not None
     
     # === CRITICAL: Detect non-product targets ===
     # These indicate FAQ queries, not product queries
-    non_product_targets = [
-        'step', 'steps', 'process', 'procedure', 'way',
-        'document', 'documents', 'requirement', 'requirements', 'paper', 'papers',
-        'time', 'times', 'duration', 'period',
-        'eligibility', 'eligible', 'qualify',
-        'fee', 'fees', 'charge', 'charges', 'cost',
-        'interest', 'rate', 'rates',
-        'apply', 'application', 'applying',
-        'approval', 'approve',
-        'withdraw', 'withdrawal', 'limit'
-    ]
-    
-    # Check if query target is non-product (FAQ indicator)
-    target_is_non_product = any(target in query_lower for target in non_product_targets)
+    target_is_non_product = _NON_PRODUCT_RE.search(query_lower) is not None
     
     if target_is_non_product:
         logging.debug(f"[Validation] 🎯 Non-product target detected (FAQ indicator)")
@@ -242,7 +266,7 @@ def validate_operations(query: str, scope: ScopeResult, evidence: Evidence) -> L
     # Special case: Multi-operation detection
     # If query has BOTH count/list signals AND non-product targets like "apply"
     # Example: "how many SBI cards and how to apply"
-    has_conjunction = any(conj in query_lower for conj in [' and ', ' & ', ', '])
+    has_conjunction = _CONJUNCTION_RE.search(query_lower) is not None
     
     if (has_count_signal or has_list_signal) and target_is_non_product and has_conjunction and evidence.db_count > 0:
         # Execute BOTH operations
@@ -308,14 +332,7 @@ def validate_operations(query: str, scope: ScopeResult, evidence: Evidence) -> L
         
         # CRITICAL: Detect procedural/FAQ patterns and skip implicit LIST
         # These queries should go to FAQ even with context
-        procedural_patterns = [
-            'how to', 'how do', 'how can', 'steps to', 'process to',
-            'register', 'activate', 'apply for', 'get a', 'open a',
-            'procedure', 'way to', 'method to', 'can i', 'do i need'
-        ]
-        
-        query_lower = query.lower()
-        is_procedural = any(pattern in query_lower for pattern in procedural_patterns)
+        is_procedural = _PROCEDURAL_RE.search(query_lower) is not None
         
         # Also check FAQ score - if HIGH, it's likely procedural
         is_high_faq = evidence.faq_strength >= 0.75
@@ -4,6 +4,43 @@ import re
 from typing import Dict, Optional, Any
 from src.history_manager import ContextState
 
+# Ordinal selection ("explain the 3rd one"): a whole word in one of these sets.
+# A set lookup per word replaces scanning the query with a 40-way alternation.
+_WORD_RE = re.compile(r'\w+')
+_ORDINAL_WORDS = frozenset([
+    'first', '1st', 'second', '2nd', 'third', '3rd', 'fourth', '4th', 'fifth', '5th',
+    'sixth', '6th', 'seventh', '7th', 'eighth', '8th', 'ninth', '9th', 'tenth', '10th',
+    'eleventh', '11th', 'twelfth', '12th', 'thirteenth', '13th', 'fourteenth', '14th',
+    'fifteenth', '15th', 'sixteenth', '16th', 'seventeenth', '17th', 'eighteenth', '18th',
+    'nineteenth', '19th', 'twentieth', '20th'
+])
+_BARE_NUMBER_WORDS = frozenset(str(n) for n in range(1, 21))
+
+
+def _find_ordinal(query: str) -> Optional[str]:
+    """
+    First ordinal word in the query, else (with "explain"/"details"/"show" context)
+    the first bare number 1-20; None if neither.
+    """
+    words = _WORD_RE.findall(query)
+    for word in words:
+        if word in _ORDINAL_WORDS:
+            return word
+    if 'explain' in query or 'details' in query or 'show' in query:
+        for word in words:
+            if word in _BARE_NUMBER_WORDS:
+                return word
+    return None
+
+
+# Follow-up triggers, compiled once at import (queries arrive lowercased)
+_LIST_TRIGGER_RE = re.compile(r'\b(list|show|display|what are|names)\b')
+_EXPLAIN_TRIGGER_RE = re.compile(r'\b(explain|details|about)\b')
+_RECOMMEND_TRIGGER_RE = re.compile(r'\b(best|recommend|suggest)\b')
+_WHY_TRIGGER_RE = re.compile(r'\b(why|reason|benefit|feature|advantage)\b')
+_CHOOSE_TRIGGER_RE = re.compile(r'\b(which|better|best|choose|pick|select|prefer)\b')
+
+
 class FollowupRouter:
     """
     Decides the Next Best Action based on User Query + Context State.
@@ -45,13 +82,9 @@ class FollowupRouter:
         
         # Check for ordinal selection FIRST (e.g., "explain third", "details of 5th")
         # This should take priority over generic "explain" routing
-        match = re.search(r'\b(first|1st|second|2nd|third|3rd|fourth|4th|fifth|5th|sixth|6th|seventh|7th|eighth|8th|ninth|9th|tenth|10th|eleventh|11th|twelfth|12th|thirteenth|13th|fourteenth|14th|fifteenth|15th|sixteenth|16th|seventeenth|17th|eighteenth|18th|nineteenth|19th|twentieth|20th)\b', query)
-        if not match:
-            # Fallback: try bare numbers (1-20) when used with "explain" context
-            if 'explain' in query or 'details' in query or 'show' in query:
-                match = re.search(r'\b([1-9]|1[0-9]|20)\b', query)
+        ordinal = _find_ordinal(query)
         
-        if match and state.last_response_meta.get('product_names'):
+        if ordinal and state.last_response_meta.get('product_names'):
             index_map = {
                 'first': 0, '1st': 0, '1': 0,
                 'second': 1, '2nd': 1, '2': 1,
@@ -74,7 +107,7 @@ class FollowupRouter:
                 'nineteenth': 18, '19th': 18, '19': 19,
                 'twentieth': 19, '20th': 19, '20': 19
             }
-            idx = index_map.get(match.group(1), 0)
+            idx = index_map.get(ordinal, 0)
             
             products = state.last_response_meta['product_names']
             if idx < len(products):
@@ -90,7 +123,7 @@ class FollowupRouter:
                 }
             
         # "List them", "Show me", "What are they"
-        if re.search(r'\b(list|show|display|what are|names)\b', query):
+        if _LIST_TRIGGER_RE.search(query):
             return {
                 'intent': 'LIST',
                 'confidence': 0.95,
@@ -101,7 +134,7 @@ class FollowupRouter:
             }
             
         # "Explain them", "Details" (generic - explain ALL)
-        if re.search(r'\b(explain|details|about)\b', query):
+        if _EXPLAIN_TRIGGER_RE.search(query):
             return {
                 'intent': 'EXPLAIN_ALL',
                 'confidence': 0.95,
@@ -123,13 +156,9 @@ class FollowupRouter:
         
         # "Explain the first one", "Details of 1st", "explain 5th", "explain 5"
         # First try to match ordinal words/suffixes
-        match = re.search(r'\b(first|1st|second|2nd|third|3rd|fourth|4th|fifth|5th|sixth|6th|seventh|7th|eighth|8th|ninth|9th|tenth|10th|eleventh|11th|twelfth|12th|thirteenth|13th|fourteenth|14th|fifteenth|15th|sixteenth|16th|seventeenth|17th|eighteenth|18th|nineteenth|19th|twentieth|20th)\b', query)
-        if not match:
-            # Fallback: try bare numbers (1-20) when used with "explain" context
-            if 'explain' in query or 'details' in query or 'show' in query:
-                match = re.search(r'\b([1-9]|1[0-9]|20)\b', query)
+        ordinal = _find_ordinal(query)
         
-        if match and state.last_response_meta.get('product_names'):
+        if ordinal and state.last_response_meta.get('product_names'):
             index_map = {
                 'first': 0, '1st': 0, '1': 0,
                 'second': 1, '2nd': 1, '2': 1,
@@ -142,11 +171,11 @@ class FollowupRouter:
                 'ninth': 8, '9th': 8, '9': 8,
                 'tenth': 9, '10th': 9, '10': 9
             }
-            idx = index_map.get(match.group(1), 0)
+            idx = index_map.get(ordinal, 0)
             
             products = state.last_response_meta['product_names']
             logging.info(f"[FollowUp LIST] Found {len(products)} products in state")
-            logging.info(f"[FollowUp LIST] Matched ordinal: '{match.group(1)}' → index: {idx}")
+            logging.info(f"[FollowUp LIST] Matched ordinal: '{ordinal}' → index: {idx}")
             
             if idx < len(products):
                 target_product = products[idx].strip()
@@ -165,7 +194,7 @@ class FollowupRouter:
                 logging.warning(f"[FollowUp LIST] ❌ Index {idx} out of range (have {len(products)} products)")
 
         # "Which is best", "Recommend"
-        if re.search(r'\b(best|recommend|suggest)\b', query):
+        if _RECOMMEND_TRIGGER_RE.search(query):
             return {
                 'intent': 'RECOMMEND',
                 'confidence': 0.95,
@@ -181,7 +210,7 @@ class FollowupRouter:
         """RECOMMEND -> EXPLAIN (for 'why?', 'reason?')"""
         
         # "Why?", "Why that one?", "What are the benefits?", "Reasons?"
-        if re.search(r'\b(why|reason|benefit|feature|advantage)\b', query):
+        if _WHY_TRIGGER_RE.search(query):
             # Get the recommended product from state
             recommended = state.recommended_product
             
@@ -205,7 +234,7 @@ class FollowupRouter:
         """COMPARE -> RECOMMEND (for 'which is better?')"""
         
         # "Which is better?", "Which should I choose?", "Which one?"
-        if re.search(r'\b(which|better|best|choose|pick|select|prefer)\b', query):
+        if _CHOOSE_TRIGGER_RE.search(query):
             # Get compared products from state
             compared = state.compared_products
             
@@ -233,13 +262,9 @@ class FollowupRouter:
         logging.info(f"[FollowUp EXPLAIN] Products in state: {len(state.last_response_meta.get('product_names', []))}")
         
         # Check for ordinal selection (same logic as LIST)
-        match = re.search(r'\b(first|1st|second|2nd|third|3rd|fourth|4th|fifth|5th|sixth|6th|seventh|7th|eighth|8th|ninth|9th|tenth|10th|eleventh|11th|twelfth|12th|thirteenth|13th|fourteenth|14th|fifteenth|15th|sixteenth|16th|seventeenth|17th|eighteenth|18th|nineteenth|19th|twentieth|20th)\b', query)
-        if not match:
-            # Fallback: try bare numbers (1-20) when used with "explain" context
-            if 'explain' in query or 'details' in query or 'show' in query:
-                match = re.search(r'\b([1-9]|1[0-9]|20)\b', query)
+        ordinal = _find_ordinal(query)
         
-        if match and state.last_response_meta.get('product_names'):
+        if ordinal and state.last_response_meta.get('product_names'):
             index_map = {
                 'first': 0, '1st': 0, '1': 0,
                 'second': 1, '2nd': 1, '2': 1,
@@ -262,10 +287,10 @@ class FollowupRouter:
                 'nineteenth': 18, '19th': 18, '19': 19,
                 'twentieth': 19, '20th': 19, '20': 19
             }
-            idx = index_map.get(match.group(1), 0)
+            idx = index_map.get(ordinal, 0)
             
             products = state.last_response_meta['product_names']
-            logging.info(f"[FollowUp EXPLAIN] Matched ordinal: '{match.group(1)}' → index: {idx}")
+            logging.info(f"[FollowUp EXPLAIN] Matched ordinal: '{ordinal}' → index: {idx}")
             
             if idx < len(products):
                 target_product = products[idx].strip()
@@ -2,13 +2,76 @@
 import logging
 import re
 import json
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass, field, asdict
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple, NamedTuple, Sequence, Union
+from dataclasses import dataclass, field, asdict, replace
+
+from src.config import bank_matcher, find_banks
 
 # Caching for DB queries (Separate logic to avoid circular imports)
 _supported_banks_cache = None
 _supported_categories_cache = None
 
+# Reconstructed states by (bank/category lists, history fingerprint): each turn re-derives the state from
+# the same (growing) history, and test sweeps replay identical mock histories
+STATE_CACHE_SIZE = 256
+_state_cache: "OrderedDict[tuple, ContextState]" = OrderedDict()
+_state_cache_lock = threading.Lock()
+
+# Metadata fields extract_state reads (the rest can't change the resulting state)
+_STATE_META_KEYS = ('intent', 'product_names', 'count', 'bank', 'category',
+                    'recommended_product', 'compared_products')
+
+# Text-parsing fallback for bot messages without metadata, compiled once at import
+_LIST_COUNT_RE = re.compile(r'\((\d+)\s+total\)')  # "(10 total)"
+_LIST_HEADER_BANK_RE = re.compile(r'📋\s*([A-Z]+)\s+')  # "📋 SBI Debit Cards"
+_LIST_MARKER_RE = re.compile(r'^(\d+\.|\d+\)|-|•|→)\s*')  # "1. ", "2) ", "- ", "• "
+_NAME_SEPARATOR_RE = re.compile(r'\s+(-|–|:)\s+')  # "Name - Rs. 250"
+_PRODUCT_LIKE_RE = re.compile(r'^[A-Z][A-Za-z0-9\s\-&]+$')
+_THERE_ARE_RE = re.compile(r'there are (\d+)')
+_DETAILS_FOR_RE = re.compile(r'details for ([^:]+)', re.IGNORECASE)
+_BOLD_NAME_RE = re.compile(r'\*\*([A-Za-z0-9\s\-\.]+?)\*\*')
+_WOULD_BE_THE_RE = re.compile(r'(?:would|likely|probably)\s+be\s+the\s+([A-Z][A-Za-z0-9\s]+?(?:Card|Loan|Account))')
+_THE_PRODUCT_IS_RE = re.compile(r'the ([A-Z][A-Za-z0-9\s]+?(?:Card|Loan|Account))\s+(?:might|is|would|could)')
+_BULLET_NAME_RE = re.compile(r'[\d\.\-•]\s*([A-Za-z0-9\s]+?)(?:\s-|\n|:)')
+
+
+def _freeze(value):
+    """Hashable form of a metadata value (lists -> tuples)"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _copy_state(state: "ContextState") -> "ContextState":
+    """Copy of state with its own dicts/lists (cheaper than copy.deepcopy)"""
+    return replace(
+        state,
+        active_filters=dict(state.active_filters),
+        last_response_meta={
+            k: list(v) if isinstance(v, list) else v for k, v in state.last_response_meta.items()
+        },
+        compared_products=list(state.compared_products)
+    )
+
+
+def _history_key(chat_history: Sequence["HistoryMessage"]) -> tuple:
+    """Fingerprint of everything extract_state reads from the history"""
+    key = []
+    for msg in chat_history:
+        metadata = msg.get('metadata') or {}
+        key.append((
+            msg.get('role'),
+            msg.get('content', ''),
+            tuple(_freeze(metadata.get(k)) for k in _STATE_META_KEYS) if metadata else None
+        ))
+    return tuple(key)
+
+
 @dataclass
 class ContextState:
     """Snapshot of the conversation state."""
@@ -27,6 +90,49 @@ class ContextState:
     def to_dict(self):
         return asdict(self)
 
+@lru_cache(maxsize=8)
+def _category_matchers(patterns: Tuple[Tuple[str, str], ...]):
+    """(alternation of all category patterns, [(compiled pattern, category)] in priority order)"""
+    if not patterns:
+        return None, []
+    any_re = re.compile("|".join(f"(?:{pattern})" for pattern, _ in patterns))
+    return any_re, [(re.compile(pattern), cat) for pattern, cat in patterns]
+
+
+class Message(NamedTuple):
+    """
+    Immutable chat message, interchangeable with the {'role', 'content', 'metadata'}
+    dicts stored by the app. Tuples of Messages are compact (no per-message dict)
+    and hashable, which suits fixed histories such as test fixtures.
+    """
+    role: str
+    content: str
+    metadata: Optional[Dict[str, Any]] = None
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """dict.get-style field access, so history code handles both forms"""
+        if key in self._fields:
+            value = getattr(self, key)
+            return default if value is None else value
+        return default
+
+
+HistoryMessage = Union[Dict[str, Any], Message]
+
+
+@lru_cache(maxsize=STATE_CACHE_SIZE)
+def _parse_bot_text(content: str, bank: Optional[str]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    (intent, last_response_meta entries) parsed from a bot message without metadata.
+    A turn stays in the history for the rest of the conversation, so each new
+    follow-up reuses its parse instead of re-running the text heuristics.
+    Callers must copy the returned values (see _analyze_last_bot_response).
+    """
+    scratch = ContextState(bank=bank)
+    HistoryStateManager._parse_bot_response(content, scratch)
+    return scratch.active_intent, scratch.last_response_meta
+
+
 class HistoryStateManager:
     """
     Reconstructs conversation state from chat history.
@@ -35,8 +141,16 @@ class HistoryStateManager:
     def __init__(self):
         self.banks = self._get_supported_banks()
         self.categories = self._get_supported_categories()
+        # Compiled once per bank/category list and shared by all instances
+        self._bank_matcher = bank_matcher(tuple(self.banks))
+        self._any_category_re, self._category_matchers = _category_matchers(
+            tuple(self._build_category_patterns())
+        )
+        # Part of every state-cache key: the same history parses differently
+        # once the bank/category lists change
+        self._lexicon_key = (tuple(self.banks), tuple(self.categories))
         
-    def extract_state(self, chat_history: List[Dict]) -> ContextState:
+    def extract_state(self, chat_history: Sequence[HistoryMessage]) -> ContextState:
         """
         Main entry point: Analyze history to build state.
         PRIORITY 1: Read from metadata (guaranteed accurate)
@@ -44,7 +158,31 @@ class HistoryStateManager:
        """
         if not chat_history:
             return ContextState()
-            
+        
+        try:
+            key = (self._lexicon_key, _history_key(chat_history))
+        except TypeError:
+            # Unhashable metadata value: parse without caching
+            return self._extract_state(chat_history)
+        
+        with _state_cache_lock:
+            cached = _state_cache.get(key)
+            if cached is not None:
+                _state_cache.move_to_end(key)
+        if cached is not None:
+            logging.debug("[HistoryState] Cache hit")
+            # Callers get their own copy so the cached state can't be mutated
+            return _copy_state(cached)
+        
+        state = self._extract_state(chat_history)
+        with _state_cache_lock:
+            _state_cache[key] = _copy_state(state)
+            if len(_state_cache) > STATE_CACHE_SIZE:
+                _state_cache.popitem(last=False)
+        return state
+
+    def _extract_state(self, chat_history: Sequence[HistoryMessage]) -> ContextState:
+        """Uncached state reconstruction (see extract_state)"""
         state = ContextState()
         
         # 1. Extract Persistent Entities (Bank/Category) from USER messages
@@ -131,14 +269,25 @@ class HistoryStateManager:
         return state
 
     def _analyze_last_bot_response(self, content: str, state: ContextState):
-        """Reverse-engineer what the bot just showed."""
+        """Reverse-engineer what the bot just showed (parsed once per distinct message)."""
+        intent, meta = _parse_bot_text(content, state.bank)
+        if intent:
+            state.active_intent = intent
+        for key, value in meta.items():
+            state.last_response_meta[key] = list(value) if isinstance(value, list) else value
+
+    @staticmethod
+    def _parse_bot_response(content: str, state: ContextState):
+        """Uncached parse of a bot message into state (see _parse_bot_text)."""
+        # Lowercased once; every intent check below reads this copy
+        content_lower = content.lower()
         
         # Detect LIST
-        if '📋' in content and 'total' in content.lower():
+        if '📋' in content and 'total' in content_lower:
             state.active_intent = 'LIST'
             
             # Extract count: "(10 total)"
-            match = re.search(r'\((\d+)\s+total\)', content)
+            match = _LIST_COUNT_RE.search(content)
             if match:
                 state.last_response_meta['count_shown'] = int(match.group(1))
             
@@ -154,26 +303,26 @@ class HistoryStateManager:
             if state.bank:
                 current_bank = state.bank
             else:
-                header_match = re.search(r'📋\s*([A-Z]+)\s+', content)
+                header_match = _LIST_HEADER_BANK_RE.search(content)
                 if header_match:
                     current_bank = header_match.group(1)
             
-            for line in content.split('\n'):
+            for line, line_lower in zip(content.split('\n'), content_lower.split('\n')):
                 line = line.strip()
-                if not line or line.startswith('📋') or line.startswith('💡') or '(total)' in line.lower():
+                if not line or line.startswith('📋') or line.startswith('💡') or '(total)' in line_lower:
                     continue
                     
                 # Remove markdown bold markers if present
                 clean = line.replace('**', '')
                 
                 # Remove list markers (numbers, bullets) if present
-                clean = re.sub(r'^(\d+\.|\d+\)|-|•|→)\s*', '', clean)
+                clean = _LIST_MARKER_RE.sub('', clean)
                 clean = clean.strip()
                 
                 # Check if line contains a product
                 if ' - ' in clean or ' – ' in clean:
                     # Has dash separator - split to get product name
-                    split_match = re.split(r'\s+(-|–|:)\s+', clean, maxsplit=1)
+                    split_match = _NAME_SEPARATOR_RE.split(clean, maxsplit=1)
                     if split_match and len(split_match) >= 1:
                         product_name = split_match[0].strip()
                         if product_name and len(product_name) > 3:
@@ -185,7 +334,7 @@ class HistoryStateManager:
                         # Likely a product name like "SBI Debit Card"
                         if len(clean) > 3 and len(clean) < 100:
                             products.append(clean)
-                    elif re.match(r'^[A-Z][A-Za-z0-9\s\-&]+$', clean) and len(clean.split()) >= 2:
+                    elif _PRODUCT_LIKE_RE.match(clean) and len(clean.split()) >= 2:
                         # Looks like a proper product name (capitalized, multiple words)
                         if len(clean) < 100:  # Sanity check
                             products.append(clean)
@@ -194,62 +343,62 @@ class HistoryStateManager:
             logging.debug(f"[HistoryState] Extracted {len(products)} products: {products[:3]}...")
 
         # Detect COUNT ("There are 5 cards...")
-        elif 'there are' in content.lower() and ('cards' in content.lower() or 'loans' in content.lower()):
+        elif 'there are' in content_lower and ('cards' in content_lower or 'loans' in content_lower):
             state.active_intent = 'COUNT'
             # Extract number
-            match = re.search(r'there are (\d+)', content.lower())
+            match = _THERE_ARE_RE.search(content_lower)
             if match:
                 state.last_response_meta['count_shown'] = int(match.group(1))
 
         # Detect EXPLAIN ("Here are the details for...")
-        elif 'details for' in content.lower() or 'features of' in content.lower():
+        elif 'details for' in content_lower or 'features of' in content_lower:
             state.active_intent = 'EXPLAIN'
             # Extract product name if possible
             # "Here are the details for HDFC Regalia:"
-            match = re.search(r'details for ([^:]+)', content, re.IGNORECASE)
+            match = _DETAILS_FOR_RE.search(content)
             if match:
                 state.last_response_meta['product_explained'] = match.group(1).strip()
 
         # Detect COMPARE ("Comparison of...")
-        elif 'comparison' in content.lower() or ' vs ' in content.lower():
+        elif 'comparison' in content_lower or ' vs ' in content_lower:
             state.active_intent = 'COMPARE'
 
         # Detect RECOMMEND ("Recommendations: ...")
-        elif 'recommendation' in content.lower() or 'suggest' in content.lower() or 'best' in content.lower() or 'might be' in content.lower():
+        elif 'recommendation' in content_lower or 'suggest' in content_lower or 'best' in content_lower or 'might be' in content_lower:
             state.active_intent = 'RECOMMEND'
             # Heuristic 1: Look for bolded product name "**Product Name**"
-            match = re.search(r'\*\*([A-Za-z0-9\s\-\.]+?)\*\*', content)
+            match = _BOLD_NAME_RE.search(content)
             if match:
                 state.last_response_meta['recommended_product'] = match.group(1).strip()
             else:
                 # Heuristic 2: Look for "the X might be" or "X is a great"
-                match = re.search(r'the ([A-Z][A-Za-z0-9\s]+?(?:Card|Loan|Account))\s+(?:might|is|would|could)', content)
+                match = _THE_PRODUCT_IS_RE.search(content)
                 if match:
                     state.last_response_meta['recommended_product'] = match.group(1).strip()
                 else:
                     # Heuristic 3: Look for bullet points
-                    match = re.search(r'[\d\.\-•]\s*([A-Za-z0-9\s]+?)(?:\s-|\n|:)', content)
+                    match = _BULLET_NAME_RE.search(content)
                     if match:
                         state.last_response_meta['recommended_product'] = match.group(1).strip()
 
     def _extract_bank(self, content: str) -> Optional[str]:
-        for bank in self.banks:
-            if bank.lower() in content:
-                return bank
-        return None
+        # Whole-word mentions, same rules as the router; list order decides
+        banks = find_banks(content, self._bank_matcher)
+        return banks[0] if banks else None
 
     def _extract_category(self, content: str) -> Optional[str]:
-        # Dynamic patterns
-        patterns = self._build_category_patterns()
-        for pattern, cat in patterns:
-            if re.search(pattern, content):
+        # One scan rules out messages without any category; otherwise pattern order decides
+        if self._any_category_re is None or not self._any_category_re.search(content):
+            return None
+        for pattern, cat in self._category_matchers:
+            if pattern.search(content):
                 return cat
         return None
 
     def _extract_recommended_product(self, content: str) -> Optional[str]:
         """Extract the recommended product name from RECOMMEND responses."""
         # Heuristic 1: Look for bolded product name "**Product Name**"
-        match = re.search(r'\*\*([A-Za-z0-9\s\-\.]+?)\*\*', content)
+        match = _BOLD_NAME_RE.search(content)
         if match:
             product = match.group(1).strip()
             # Filter out common non-product bold text
@@ -257,17 +406,17 @@ class HistoryStateManager:
                 return product
         
         # Heuristic 2: "would be the X Card/Loan" or "likely be the X Card"
-        match = re.search(r'(?:would|likely|probably)\s+be\s+the\s+([A-Z][A-Za-z0-9\s]+?(?:Card|Loan|Account))', content)
+        match = _WOULD_BE_THE_RE.search(content)
         if match:
             return match.group(1).strip()
         
         # Heuristic 3: "the X might be" or "X is a great"
-        match = re.search(r'the ([A-Z][A-Za-z0-9\s]+?(?:Card|Loan|Account))\s+(?:might|is|would|could)', content)
+        match = _THE_PRODUCT_IS_RE.search(content)
         if match:
             return match.group(1).strip()
         
         # Heuristic 4: Look for bullet points
-        match = re.search(r'[\d\.\-•]\s*([A-Za-z0-9\s]+?)(?:\s-|\n|:)', content)
+        match = _BULLET_NAME_RE.search(content)
         if match:
             return match.group(1).strip()
         
@@ -281,8 +430,8 @@ class HistoryStateManager:
         if _supported_banks_cache: return _supported_banks_cache
         
         try:
-            from src.database import DatabaseManager
-            db = DatabaseManager()
+            from src.multi_retriever import get_db
+            db = get_db()
             res = db.execute_raw_query("SELECT DISTINCT bank_name FROM products WHERE bank_name IS NOT NULL")
             _supported_banks_cache = [r['bank_name'] for r in res] or ['SBI', 'HDFC']
         except:
@@ -294,8 +443,8 @@ class HistoryStateManager:
         if _supported_categories_cache: return _supported_categories_cache
         
         try:
-            from src.database import DatabaseManager
-            db = DatabaseManager()
+            from src.multi_retriever import get_db
+            db = get_db()
             res = db.execute_raw_query("SELECT DISTINCT category FROM products WHERE category IS NOT NULL")
             _supported_categories_cache = [r['category'] for r in res] or ['Credit Card', 'Loan']
         except:
@@ -14,9 +14,8 @@ from pathlib import Path
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.database import DatabaseManager
-from src.vector_db import FAQVectorDB
-from src.config import PRODUCTS_DIR, FAQS_DIR, OPENAI_API_KEY, LLM_MODEL
+from src.multi_retriever import get_db, get_vector_db
+from src.config import DB_PATH, PRODUCTS_DIR, FAQS_DIR, OPENAI_API_KEY, LLM_MODEL
 from src.dynamic_utils import (
     smart_detect_bank,
     smart_map_columns,
@@ -35,8 +34,47 @@ logging.basicConfig(
     ]
 )
 
-db = DatabaseManager()
-vector_db = FAQVectorDB()
+# Process-wide instances: ingesting and then querying in the same process
+# reuses one SQLite connection, Chroma client and embedding model
+db = get_db()
+vector_db = get_vector_db()
+
+# Records {"products": {file_path: mtime}, "faqs": {file_path: mtime}} of successfully
+# ingested files so re-runs only touch changed files. Kept next to the DB it describes.
+MANIFEST_PATH = os.path.join(os.path.dirname(str(DB_PATH)), ".ingest_manifest.json")
+
+
+def load_manifest() -> dict:
+    """Load the ingest manifest, or an empty one if missing/corrupt"""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    if not isinstance(manifest, dict):
+        manifest = {}
+    return {
+        'products': dict(manifest.get('products') or {}),
+        'faqs': dict(manifest.get('faqs') or {}),
+    }
+
+
+def save_manifest(manifest: dict):
+    """Persist the ingest manifest"""
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_csv_fast(file_path: str):
+    """
+    Load a CSV using the multithreaded pyarrow parser (several times faster on
+    wide files), falling back to the default pandas engine if pyarrow is unavailable.
+    """
+    try:
+        return pd.read_csv(file_path, engine="pyarrow")
+    except (ImportError, ValueError) as e:
+        logging.debug(f"pyarrow CSV engine unavailable ({e}), using default parser")
+        return pd.read_csv(file_path)
 
 
 def process_csv_dynamic(file_path: str):
@@ -51,10 +89,11 @@ def process_csv_dynamic(file_path: str):
     
     try:
         # Load CSV
-        df = pd.read_csv(file_path)
+        df = read_csv_fast(file_path)
         
-        # Edge Case: No headers detected
-        if df.columns[0].startswith('Unnamed') or pd.isna(df.columns[0]):
+        # Edge Case: No headers detected (pyarrow leaves blank header names empty)
+        first_col = df.columns[0]
+        if pd.isna(first_col) or not str(first_col).strip() or str(first_col).startswith('Unnamed'):
             logging.warning("⚠️  No headers detected, inferring from first row...")
             first_row = df.iloc[0].tolist()
             inferred_headers = infer_headers_llm(first_row)
@@ -78,30 +117,32 @@ def process_csv_dynamic(file_path: str):
         count = 0
         skipped = 0
         
-        for _, row in df.iterrows():
-            # Clean NaN values
-            row = row.where(pd.notnull(row), None)
-            
-            try:
-                # Extract with dynamic column handling
-                product_obj = extract_product_with_unlimited_columns(row, column_mapping, bank_name)
+        # One transaction per file instead of one commit per row
+        with db.transaction():
+            for _, row in df.iterrows():
+                # Clean NaN values
+                row = row.where(pd.notnull(row), None)
                 
-                # Validate critical fields
-                if not product_obj.get('product_name') or not product_obj.get('category'):
+                try:
+                    # Extract with dynamic column handling
+                    product_obj = extract_product_with_unlimited_columns(row, column_mapping, bank_name)
+                    
+                    # Validate critical fields
+                    if not product_obj.get('product_name') or not product_obj.get('category'):
+                        skipped += 1
+                        continue
+                    
+                    # Add source metadata
+                    product_obj['source_file'] = filename
+                    
+                    # Upsert to database
+                    db.upsert_product(product_obj)
+                    count += 1
+                    
+                except Exception as e:
+                    logging.warning(f"   ⚠️  Skipped row: {e}")
                     skipped += 1
                     continue
-                
-                # Add source metadata
-                product_obj['source_file'] = filename
-                
-                # Upsert to database
-                db.upsert_product(product_obj)
-                count += 1
-                
-            except Exception as e:
-                logging.warning(f"   ⚠️  Skipped row: {e}")
-                skipped += 1
-                continue
         
         logging.info(f"✅ Processed {count} products ({skipped} skipped)")
         return count
@@ -182,9 +223,11 @@ def process_json_dynamic(file_path: str):
         return 0
 
 
-def process_all_files():
+def process_all_files(force: bool = False):
     """
     Main ingestion - processes ALL supported file formats
+    
+    Files whose mtime matches the ingest manifest are skipped unless force=True.
     """
     logging.info("\n" + "="*80)
     logging.info("🚀 DYNAMIC INGESTION PIPELINE")
@@ -199,8 +242,18 @@ def process_all_files():
     logging.info(f"\n📂 Found {len(all_files)} product files")
     
     total_products = 0
+    manifest = load_manifest()
+    # An empty products table (deleted/new DB) means the manifest no longer describes it
+    seen = manifest['products'] if not force and db.count_products() > 0 else {}
+    ingested = {}
+    skipped = 0
     
     for file_path in all_files:
+        mtime = os.path.getmtime(file_path)
+        if seen.get(file_path) == mtime:
+            skipped += 1
+            continue
+        
         file_format = detect_file_format(file_path)
         
         if file_format in ['csv']:
@@ -213,8 +266,21 @@ def process_all_files():
             logging.warning(f"⚠️  Unsupported format: {file_format}")
             continue
         
+        if count > 0:
+            ingested[file_path] = mtime
         total_products += count
     
+    # A full re-ingest (force / empty table) starts the products section over
+    manifest['products'] = {**manifest['products'], **ingested} if seen else ingested
+    save_manifest(manifest)
+
+    # Rebuild the recommendation tables once per run rather than per upsert
+    if total_products:
+        db.refresh_materialized_views()
+
+    if skipped:
+        logging.info(f"\n⏭️  Skipped {skipped} unchanged product files")
+    
     logging.info(f"\n{'='*80}")
     logging.info(f"✅ INGESTION COMPLETE: {total_products} total products")
     logging.info(f"{'='*80}\n")
@@ -222,23 +288,36 @@ def process_all_files():
     return total_products
 
 
-def process_faqs_dynamic():
+def process_faqs_dynamic(force: bool = False):
     """
     Process FAQ files with intelligent column mapping and extra fields support
+    
+    The collection is rebuilt from all FAQ files, so it is only reset when at
+    least one FAQ file changed since the last run (or force=True).
     """
     from src.dynamic_faq_utils import fuzzy_map_faq_columns, extract_faq_with_extra_columns
     
     faq_files = glob.glob(os.path.join(FAQS_DIR, "*.csv"))
+    manifest = load_manifest()
+    faq_mtimes = {file_path: os.path.getmtime(file_path) for file_path in faq_files}
+    
+    # Same file set (an added or deleted file forces a rebuild), same mtimes, and a
+    # populated collection (a wiped chromadb_data/ leaves the manifest stale)
+    if not force and manifest['faqs'] == faq_mtimes and vector_db.collection.count() > 0:
+        logging.info(f"\n📚 {len(faq_files)} FAQ files unchanged, skipping re-embedding")
+        return
+    
     logging.info(f"\n📚 Processing {len(faq_files)} FAQ files...")
     
     vector_db.reset_collection()
+    manifest['faqs'] = {}
     
     for file_path in faq_files:
         filename = os.path.basename(file_path)
         logging.info(f"\n  📄 {filename}")
         
         try:
-            df = pd.read_csv(file_path)
+            df = read_csv_fast(file_path)
             logging.info(f"     Loaded {len(df)} FAQs, {len(df.columns)} columns")
             
             # Intelligently map columns
@@ -264,11 +343,13 @@ def process_faqs_dynamic():
             
             # Upsert to ChromaDB
             vector_db.upsert_faqs(records)
+            manifest['faqs'][file_path] = faq_mtimes[file_path]
             logging.info(f"  ✅ {filename}: {len(records)} FAQs ingested")
             
         except Exception as e:
             logging.error(f"  ❌ {filename}: {e}")
     
+    save_manifest(manifest)
     logging.info("\n✅ FAQ ingestion complete\n")
 
 
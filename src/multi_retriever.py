@@ -1,10 +1,44 @@
 import logging
 import json
+import threading
 from typing import List, Dict, Any
 
-from src.database import DatabaseManager
+from src.database import DatabaseManager, attributes_version
 from src.vector_db import FAQVectorDB
 
+# Shared across retriever instances so each one doesn't open its own
+# SQLite connection and Chroma client / embedding model
+_db = None
+_vector_db = None
+# Concurrent first calls (e.g. parallel queries) must not each load a model
+_shared_lock = threading.Lock()
+
+
+def get_db() -> DatabaseManager:
+    """Get the shared DatabaseManager (created on first use)"""
+    global _db
+    if _db is None:
+        with _shared_lock:
+            if _db is None:
+                _db = DatabaseManager()
+    return _db
+
+
+def get_vector_db() -> FAQVectorDB:
+    """Get the shared FAQVectorDB (created on first use)"""
+    global _vector_db
+    if _vector_db is None:
+        with _shared_lock:
+            if _vector_db is None:
+                _vector_db = FAQVectorDB()
+    return _vector_db
+
+
+# Query-intent hints used by _score_and_rank (substring match on the lowered query)
+PROCEDURAL_HINTS = ('how to', 'procedure', 'apply', 'block', 'documents', 'activate')
+PRODUCT_HINTS = ('card', 'loan', 'product', 'fee', 'rate', 'interest', 'eligibility')
+
+
 class MultiSourceRetriever:
     """
     Searches all available sources in parallel and fuses results.
@@ -12,8 +46,8 @@ class MultiSourceRetriever:
     """
     
     def __init__(self):
-        self.db = DatabaseManager()
-        self.vector_db = FAQVectorDB()
+        self.db = get_db()
+        self.vector_db = get_vector_db()
         logging.info("MultiSourceRetriever initialized")
     
     def retrieve(self, query: str, max_results: int = 15, chat_history=None) -> Dict[str, Any]:
@@ -45,6 +79,19 @@ class MultiSourceRetriever:
         
         logging.info(f"Retrieved {len(sql_results)} SQL results, {len(faq_results)} FAQ results")
         
+        # Nothing to fuse/rank - skip the pipeline
+        if not sql_results and not faq_results:
+            return {
+                'results': [],
+                'metadata': {
+                    'sql_count': 0,
+                    'faq_count': 0,
+                    'sources_searched': ['SQL Product Catalog', 'FAQ Vector DB'],
+                    'total_candidates': 0,
+                    'final_count': 0
+                }
+            }
+        
         # === FUSION ===
         all_results = self._combine_sources(sql_results, faq_results)
         
@@ -79,7 +126,7 @@ class MultiSourceRetriever:
             category: Filter by product category (optional)
             
         Returns:
-            List of product dicts from database
+            List of product dicts from database (attributes parsed to dict)
         """
         try:
             # Build SQL query
@@ -115,6 +162,17 @@ class MultiSourceRetriever:
             # Execute query using the correct method name
             results = self.db.execute_raw_query(query, tuple(params))
             
+            # Parse attributes JSON once here so formatters get dicts; attrs_version
+            # fingerprints the raw string for the formatters' cache keys
+            for row in results:
+                attrs = row.get('attributes')
+                if isinstance(attrs, str):
+                    row['attrs_version'] = attributes_version(attrs)
+                    try:
+                        row['attributes'] = json.loads(attrs) if attrs else {}
+                    except ValueError:
+                        row['attributes'] = {}
+            
             logging.info(f"[get_all_products] Retrieved {len(results)} products (bank={bank}, category={category})")
             
             return results
@@ -208,23 +266,23 @@ class MultiSourceRetriever:
     
     def _deduplicate_by_product_name(self, results: List[Dict]) -> List[Dict]:
         """
-        Remove duplicate products based on product_name.
+        Remove duplicate products based on product_name (case-insensitive).
         Keeps the first occurrence of each unique product.
         """
-        seen_products = set()
-        unique_results = []
-        
+        seen_products = {}  # Insertion-ordered: lowercased name -> first result
+        faq_results = []
+
         for result in results:
             if result['type'] == 'product':
-                product_name = result['raw_data'].get('product_name', '').strip()
-                if product_name and product_name not in seen_products:
-                    seen_products.add(product_name)
-                    unique_results.append(result)
+                key = (result['raw_data'].get('product_name') or '').strip().lower()
+                if key and key not in seen_products:
+                    seen_products[key] = result
             else:
                 # Keep all FAQ results
-                unique_results.append(result)
-        
-        return unique_results
+                faq_results.append(result)
+
+        # Products precede FAQs in the combined input, so this preserves order
+        return list(seen_products.values()) + faq_results
     
     def _combine_sources(self, *source_results: List[Dict]) -> List[Dict]:
         """Combine results from multiple sources into single list."""
@@ -242,26 +300,33 @@ class MultiSourceRetriever:
         - Query-result similarity (keyword matching)
         - Result type preference based on query intent
         """
+        if not results:
+            return results
+        
+        # Query-only work is done once, not per result
         query_lower = query.lower()
+        query_words = set(query_lower.split())
+        query_len = max(len(query_words), 1)
+        is_procedural = any(word in query_lower for word in PROCEDURAL_HINTS)
+        is_product = not is_procedural and any(word in query_lower for word in PRODUCT_HINTS)
         
         for result in results:
             # Start with source confidence
             score = result['confidence']
             
             # Boost for query type alignment
-            if any(word in query_lower for word in ['how to', 'procedure', 'apply', 'block', 'documents', 'activate']):
+            if is_procedural:
                 # Procedural query - boost FAQs
                 if result['type'] == 'faq':
                     score += 0.15
-            elif any(word in query_lower for word in ['card', 'loan', 'product', 'fee', 'rate', 'interest', 'eligibility']):
+            elif is_product:
                 # Product query - boost SQL
                 if result['type'] == 'product':
                     score += 0.15
             
             # Keyword overlap boost (simple but effective)
-            query_words = set(query_lower.split())
             content_words = set(result['content'].lower().split())
-            overlap = len(query_words & content_words) / max(len(query_words), 1)
+            overlap = len(query_words & content_words) / query_len
             score += overlap * 0.2
             
             result['final_score'] = score
@@ -6,18 +6,39 @@ Part of the zero-hardcoding initiative to remove all keyword lists.
 """
 
 import logging
+import re
 from functools import lru_cache
 from openai import OpenAI
-from src.config import OPENAI_API_KEY
+from src.config import OPENAI_API_KEY, SUPPORTED_BANKS, PRODUCT_CATEGORIES
 
 client = OpenAI(api_key=OPENAI_API_KEY)
 
+# Obvious banking terms - matched locally so the LLM is only asked about unclear queries
+BANKING_TERMS = [
+    'loan', 'card', 'account', 'interest', 'fee', 'emi', 'fd', 'apply', r'eligib\w*',
+    'bank', 'scheme', 'deposit', 'credit', 'debit', 'balance', 'kyc'
+]
+
+# One compiled alternation scanned in a single pass; duplicates removed and
+# longer alternatives first so the matcher backtracks as little as possible
+_BANKING_ALTERNATIVES = sorted(
+    set(
+        [re.escape(b.lower()) for b in SUPPORTED_BANKS] +
+        [re.escape(c.lower()) for c in PRODUCT_CATEGORIES] +
+        BANKING_TERMS
+    ),
+    key=len,
+    reverse=True
+)
+_BANKING_RE = re.compile(r"\b(?:" + "|".join(_BANKING_ALTERNATIVES) + r")s?\b")
+
 @lru_cache(maxsize=500)  # Cache 500 recent queries (memory: ~50KB)
 def is_banking_query(query: str) -> bool:
     """
     Determine if a user query is related to banking/finance.
     
-    Uses GPT-4o-mini with aggressive caching to minimize cost and latency.
+    Checks a local keyword rule set first; only queries with no obvious
+    banking term are sent to GPT-4o-mini (with aggressive caching).
     
     Args:
         query: User's input query
@@ -38,6 +59,11 @@ def is_banking_query(query: str) -> bool:
     # Normalize query for better cache hits
     query_normalized = query.lower().strip()
     
+    # Rule-based prefilter: obvious banking queries skip the LLM entirely
+    if _BANKING_RE.search(query_normalized):
+        logging.info(f"[Query Validator] '{query}' → YES (rule match)")
+        return True
+    
     try:
         response = client.chat.completions.create(
             model="gpt-4o-mini",  # Fast, cheap: $0.00015/1K tokens
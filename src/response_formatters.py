@@ -7,28 +7,383 @@ Provides deterministic, Python-based response formatting for:
 - EXPLAIN queries (detailed explanations with LLM validation)
 """
 
+import hashlib
 import json
 import logging
 import re
-from typing import List, Dict, Any
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import httpx
 from openai import OpenAI
 from src.config import LLM_MODEL, OPENAI_API_KEY
+from src.database import attributes_version
 
 # Module-level client (avoid creating inside functions)
-_client = OpenAI(api_key=OPENAI_API_KEY)
+# Pooled HTTP/2 transport: warm keep-alive connections skip the TLS handshake, and
+# concurrent calls (parallel EXPLAIN groups) multiplex over one connection.
+# HTTP/2 needs the optional h2 package (httpx[http2]); without it, pooled HTTP/1.1.
+try:
+    import h2
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+    logging.info("[Formatters] h2 not installed, using HTTP/1.1 for the OpenAI client")
 
+_client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.Client(
+        http2=_HTTP2,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
 
-def format_count_response(products: List[Dict], query_info: Dict) -> Dict[str, Any]:
+# LLM response cache: identical scope + products -> reuse the generated text.
+# Bump _PROMPT_VERSION whenever a prompt below changes.
+_PROMPT_VERSION = 5
+_RESPONSE_CACHE_SIZE = 1024
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _response_cache_key(intent: str, products: List[Dict], query_info: Dict) -> str:
+    """
+    SHA256 over everything the prompt depends on. Products enter as
+    (product_id, product_name, attrs_version), so re-ingests invalidate without
+    serializing every attributes dict on each lookup.
+    """
+    product_keys = sorted(
+        (p.get('product_id') or 0, p.get('product_name') or '', _attrs_version(p))
+        for p in products
+    )
+    raw = json.dumps([
+        intent,
+        # The prompts quote the user's question, so different questions about
+        # the same scope must not share a cached answer
+        (query_info.get('original_query') or '').strip().lower(),
+        query_info.get('bank'),
+        query_info.get('category'),
+        query_info.get('product_name'),
+        len(products),
+        product_keys,
+        LLM_MODEL,
+        _PROMPT_VERSION
+    ], default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _response_cache_lock:
+        text = _response_cache.get(key)
+        if text is not None:
+            _response_cache.move_to_end(key)
+        return text
+
+
+def _cache_set(key: str, text: str) -> str:
+    with _response_cache_lock:
+        _response_cache[key] = text
+        _response_cache.move_to_end(key)
+        if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return text
+
+
+# Prompt templates, filled with str.format_map per request
+_COUNT_PROMPT_TMPL = """You are a helpful banking assistant answering a customer's question.
+
+USER QUESTION: "{original_query}"
+
+VERIFIED DATA (from database):
+- Bank: {bank}
+- Category: {category}
+- Exact Count: {count}
+
+COMPLETE PRODUCT LIST:
+{product_list_json}
+
+CRITICAL RULES:
+1. Start with a natural, friendly answer stating the exact count ({count})
+2. List ALL {count} products naturally - do not skip any
+3. Mention product names with their fees in a conversational way
+4. Be engaging and helpful, not robotic
+5. DO NOT add products not in the list above
+6. DO NOT change the count
+
+Example tone: "SBI offers {count} {category_display}. Let me walk you through them..."
+
+Write a natural, conversational response."""
+
+_EXPLAIN_ONE_PROMPT_TMPL = """You are explaining a specific banking product.
+
+PRODUCT DETAILS:
+{full_context}
+
+CRITICAL RULES:
+1. Explain ONLY this product in detail
+2. Include:
+   - Product name and bank
+   - Annual fees
+   - Key features (detailed)
+   - Eligibility criteria
+   - Interest rate (if applicable)
+3. Be accurate - ONLY use information provided above
+4. Do NOT mention other products
+5. Do NOT make up any information
+6. Be conversational and helpful
+
+User's question: "{original_query}"
+
+Provide a detailed explanation of this product."""
+
+_EXPLAIN_ALL_PROMPT_TMPL = """You are explaining {count} banking products from {bank}.
+
+PRODUCTS TO EXPLAIN:
+{full_context}
+
+CRITICAL RULES:
+1. Explain EVERY SINGLE product listed above - do not skip any
+2. Use numbered list format (1., 2., 3., ...)
+3. For each product, include:
+   - Product name as a heading
+   - Annual fees
+   - Key features (2-3 main points)
+   - Eligibility criteria
+   - Interest rate (if applicable)
+4. Be accurate - ONLY use information provided above
+5. Do NOT make up or assume any information
+6. Start your response with: "Here are ALL {count} {category}s with full details:"
+
+User's question: "{original_query}"
+
+Remember: You MUST include all {count} products in your response."""
+
+_EXPLAIN_GROUP_PROMPT_TMPL = """You are explaining products {first}-{last} of {count} banking products from {bank}.
+
+PRODUCTS TO EXPLAIN:
+{full_context}
+
+CRITICAL RULES:
+1. Explain EVERY SINGLE product listed above - do not skip any
+2. Use numbered list format starting at {first} ({first}., {second}., ...)
+3. For each product, include:
+   - Product name as a heading
+   - Annual fees
+   - Key features (2-3 main points)
+   - Eligibility criteria
+   - Interest rate (if applicable)
+4. Be accurate - ONLY use information provided above
+5. Do NOT make up or assume any information
+6. Do NOT add an introduction or closing summary - the other products are explained separately
+
+User's question: "{original_query}"
+"""
+
+_COUNT_AND_EXPLAIN_PROMPT_TMPL = """You are a helpful banking assistant answering a customer's question.
+
+USER QUESTION: "{original_query}"
+
+VERIFIED DATA (from database):
+- Bank: {bank}
+- Category: {category}
+- Exact Count: {count}
+
+PRODUCTS:
+{full_context}
+
+Return a JSON object with exactly two keys:
+- "count_response": a friendly answer stating the exact count ({count}) and naming every product with its fees
+- "explain_response": starts with "Here are ALL {count} {category}s with full details:" then a numbered list explaining EVERY product (fees, 2-3 key features, eligibility, interest rate if applicable)
+
+CRITICAL RULES:
+1. Include all {count} products in both texts - do not skip any
+2. ONLY use the information above - do not add products or change the count"""
+
+# Large EXPLAIN_ALL requests are split into groups generated in parallel:
+# several short completions finish sooner than one long one
+EXPLAIN_GROUP_SIZE = 4
+EXPLAIN_MAX_WORKERS = 8
+
+
+def _complete(client: OpenAI, messages: List[Dict], temperature: float,
+              on_delta: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Run a chat completion and return the full text.
+    
+    With on_delta, the completion is streamed and each text chunk is passed to
+    on_delta as it arrives (so the UI can paint the first tokens immediately);
+    the accumulated text is still returned for validation.
+    """
+    if on_delta is None:
+        response = client.chat.completions.create(
+            messages=messages,
+            model=LLM_MODEL,
+            temperature=temperature
+        )
+        return response.choices[0].message.content
+    
+    parts = []
+    stream = client.chat.completions.create(
+        messages=messages,
+        model=LLM_MODEL,
+        temperature=temperature,
+        stream=True
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            on_delta(delta)
+    return "".join(parts)
+
+
+# Standalone numbers in LLM output (static pattern, so no per-count regex is compiled)
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+# Markdown emphasis/code markers stripped before matching product names in LLM output
+_MARKDOWN_MARKS_RE = re.compile(r'[*_`]')
+
+
+def _normalize_for_match(text: str) -> str:
+    """Lowercase, drop markdown markers and collapse whitespace"""
+    return ' '.join(_MARKDOWN_MARKS_RE.sub('', text).lower().split())
+
+
+@lru_cache(maxsize=256)
+def _mention_pattern(names: Tuple[str, ...]) -> "re.Pattern":
+    """Zero-width alternation of normalized names (longest first) reporting a match at every position"""
+    return re.compile("(?=(" + "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True)) + "))")
+
+
+def _find_missing_products(response_text: str, names: List[str]) -> List[str]:
+    """
+    Product names not mentioned in the LLM response.
+    
+    Matching ignores case, markdown emphasis and line-wrapping so a name the model
+    reformatted (e.g. "**SBI** Elite") isn't reported missing.
+    """
+    normalized = {name: _normalize_for_match(name) for name in names if name}
+    name_set = frozenset(n for n in normalized.values() if n)
+    if not name_set:
+        return []
+    
+    # One scan of the response. The lookahead reports the longest name starting at
+    # each position, so overlapping and nested names are all seen; names that are a
+    # prefix of a reported match occur at the same position and are added from it.
+    found = set()
+    for match in _mention_pattern(tuple(sorted(name_set))).finditer(_normalize_for_match(response_text)):
+        text = match.group(1)
+        if text in found:
+            continue
+        found.add(text)
+        found.update(text[:end] for end in range(1, len(text)) if text[:end] in name_set)
+    
+    return [name for name, norm in normalized.items() if norm and norm not in found]
+
+
+def _explain_in_groups(client: OpenAI, context_parts: List[str], query_info: Dict,
+                       on_delta: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Explain products in groups of EXPLAIN_GROUP_SIZE with concurrent LLM calls.
+    
+    Group texts are joined (and streamed to on_delta) in product order.
+    """
+    count = len(context_parts)
+    bank = query_info.get('bank', 'the bank')
+    category = query_info.get('category', 'products')
+    original_query = query_info.get('original_query', '')
+    
+    requests = []
+    for start in range(0, count, EXPLAIN_GROUP_SIZE):
+        group = context_parts[start:start + EXPLAIN_GROUP_SIZE]
+        prompt = _EXPLAIN_GROUP_PROMPT_TMPL.format_map({
+            'first': start + 1,
+            'second': start + 2,
+            'last': start + len(group),
+            'count': count,
+            'bank': bank,
+            'full_context': "\n\n".join(group),
+            'original_query': original_query
+        })
+        requests.append([
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"Explain these {len(group)} {category}s"}
+        ])
+    
+    header = f"Here are ALL {count} {category}s with full details:"
+    parts = [header]
+    if on_delta:
+        on_delta(header)
+    
+    with ThreadPoolExecutor(max_workers=min(EXPLAIN_MAX_WORKERS, len(requests))) as executor:
+        futures = [executor.submit(_complete, client, messages, 0) for messages in requests]
+        for future in futures:
+            text = future.result()
+            parts.append(text)
+            if on_delta:
+                on_delta("\n\n" + text)
+    
+    logging.info(f"[EXPLAIN] Generated {count} explanations in {len(requests)} parallel calls")
+    return "\n\n".join(parts)
+
+
+def _with_missing_note(text: str, missing_products: List[str], detail: str) -> str:
+    """Append a note listing products the LLM left out"""
+    note = "\n".join(f"- {name}" for name in missing_products)
+    return f"{text}\n\n**Note:** The following products were {detail}:\n{note}\n"
+
+
+def _get_attrs(product: Dict) -> Dict:
+    """
+    Product attributes as a dict.
+    
+    Products from MultiSourceRetriever.get_all_products are already parsed; a JSON
+    string (e.g. raw rows) is parsed once and stored back on the product.
+    """
+    attrs = product.get('attributes') or {}
+    if isinstance(attrs, str):
+        product.setdefault('attrs_version', attributes_version(attrs))
+        try:
+            attrs = json.loads(attrs)
+        except:
+            attrs = {}
+        product['attributes'] = attrs
+    return attrs
+
+
+def _attrs_version(product: Dict) -> int:
+    """
+    The product's attrs_version (set when its attributes were parsed). Products
+    built elsewhere with dict attributes are fingerprinted once and stamped.
+    """
+    version = product.get('attrs_version')
+    if version is None:
+        attrs = product.get('attributes')
+        raw = attrs if isinstance(attrs, str) else json.dumps(attrs, sort_keys=True, default=str)
+        version = product['attrs_version'] = attributes_version(raw)
+    return version
+
+
+def format_count_response(products: List[Dict], query_info: Dict, llm_text: Optional[str] = None,
+                          on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
     Format COUNT query response using HYBRID approach.
     
     Step 1: Python calculates exact count (guaranteed accuracy)
     Step 2: LLM formats naturally (conversational tone)
-    Step 3: Validation ensures correctness
+    Step 3: Validation ensures correctness (runs after streamed text has already
+            been painted via on_delta, so it never delays the first tokens)
     
     Args:
         products: List of product dicts from database
         query_info: Classification info with bank, category, etc.
+        llm_text: Already-generated LLM text (from format_count_and_explain); skips the LLM call
+        on_delta: Optional callback receiving streamed text chunks as they are generated
         
     Returns:
         Response dict with text, source, data, metadata
@@ -45,15 +400,37 @@ def format_count_response(products: List[Dict], query_info: Dict) -> Dict[str, A
     
     logging.info(f"[COUNT] Python verification: {bank} has EXACTLY {count} {category_display}")
     
+    # 0 or 1 products: a template says it all, no LLM round-trip needed
+    if count <= 1 and llm_text is None:
+        if count == 0:
+            response_text = f"**{bank}** currently offers **0** {category_display}."
+            product_names = []
+        else:
+            name = products[0].get('product_name', 'Unknown')
+            fees = _get_attrs(products[0]).get('fees')
+            response_text = f"**{bank}** currently offers **1** {category.lower()}: **{name}**"
+            response_text += f" — {fees}." if fees and fees != 'N/A' else "."
+            product_names = [name]
+        
+        return {
+            "text": response_text,
+            "source": f"SQL Database (Exact Count: {count})",
+            "data": products,
+            "metadata": {
+                "intent": "COUNT",  # For HistoryStateManager
+                "count": count,
+                "bank": bank,
+                "category": category,
+                "product_names": product_names,  # For followups
+                "method": "python_template",
+                "guaranteed_accurate": True
+            }
+        }
+    
     # Build structured product list for LLM
     product_list = []
     for i, product in enumerate(products, 1):
-        attrs = product.get('attributes', {})
-        if isinstance(attrs, str):
-            try:
-                attrs = json.loads(attrs)
-            except:
-                attrs = {}
+        attrs = _get_attrs(product)
         
         product_list.append({
             'number': i,
@@ -64,59 +441,43 @@ def format_count_response(products: List[Dict], query_info: Dict) -> Dict[str, A
     # Use module-level client (no need to import again)
     client = _client
     
-    prompt = f"""You are a helpful banking assistant answering a customer's question.
-
-USER QUESTION: "{original_query}"
-
-VERIFIED DATA (from database):
-- Bank: {bank}
-- Category: {category}
-- Exact Count: {count}
-
-COMPLETE PRODUCT LIST:
-{json.dumps(product_list, indent=2)}
-
-CRITICAL RULES:
-1. Start with a natural, friendly answer stating the exact count ({count})
-2. List ALL {count} products naturally - do not skip any
-3. Mention product names with their fees in a conversational way
-4. Be engaging and helpful, not robotic
-5. DO NOT add products not in the list above
-6. DO NOT change the count
-
-Example tone: "SBI offers {count} {category_display}. Let me walk you through them..."
-
-Write a natural, conversational response."""
+    prompt = _COUNT_PROMPT_TMPL.format_map({
+        'original_query': original_query,
+        'bank': bank,
+        'category': category,
+        'count': count,
+        'category_display': category_display,
+        # Compact JSON: same content, fewer input tokens than indent=2
+        'product_list_json': json.dumps(product_list, separators=(',', ':'), ensure_ascii=False)
+    })
 
     try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": original_query}
-            ],
-            model=LLM_MODEL,
-            temperature=0.3  # Balanced: natural but consistent
-        )
-        
-        natural_response = response.choices[0].message.content
+        cache_key = _response_cache_key("COUNT", products, query_info)
+        natural_response = _cache_get(cache_key) if llm_text is None else _cache_set(cache_key, llm_text)
+        if llm_text is None and natural_response is not None:
+            logging.info(f"[COUNT] Response cache hit")
+        elif natural_response is None:
+            natural_response = _cache_set(cache_key, _complete(
+                client,
+                [
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": original_query}
+                ],
+                temperature=0.3,  # Balanced: natural but consistent
+                on_delta=on_delta
+            ))
         
         # VALIDATION: Ensure count is mentioned correctly (use word boundary to avoid false positives)
-        count_str = str(count)
-        if not re.search(rf'\b{count_str}\b', natural_response):
+        if str(count) not in _NUMBER_RE.findall(natural_response):
             logging.warning(f"[COUNT] LLM didn't mention count {count}, adding it")
             natural_response = f"**{bank}** offers **{count} {category_display}**.\n\n" + natural_response
         
         # VALIDATION: Check if all product names are mentioned
-        missing_products = []
-        for product in product_list:
-            if product['name'] not in natural_response:
-                missing_products.append(product['name'])
+        missing_products = _find_missing_products(natural_response, [p['name'] for p in product_list])
         
         if missing_products:
             logging.warning(f"[COUNT] LLM missed {len(missing_products)} products, appending")
-            natural_response += f"\n\n**Note:** The following products were not detailed above:\n"
-            for name in missing_products:
-                natural_response += f"- {name}\n"
+            natural_response = _with_missing_note(natural_response, missing_products, "not detailed above")
         
         return {
             "text": natural_response,
@@ -138,14 +499,22 @@ Write a natural, conversational response."""
         logging.error(f"[COUNT] LLM formatting failed: {str(e)}")
         logging.exception("Full error traceback:")
         # Fallback to structured format
-        response_text = f"### 📊 Answer\n\n"
-        response_text += f"**{bank}** offers **{count}** {category_display}.\n\n"
-        response_text += f"---\n\n### 📋 Complete List:\n\n"
+        parts = [
+            "### 📊 Answer",
+            "",
+            f"**{bank}** offers **{count}** {category_display}.",
+            "",
+            "---",
+            "",
+            "### 📋 Complete List:",
+            ""
+        ]
         for item in product_list:
             if item['fees'] and item['fees'] != 'N/A':
-                response_text += f"{item['number']}. **{item['name']}** — {item['fees']}\n"
+                parts.append(f"{item['number']}. **{item['name']}** — {item['fees']}")
             else:
-                response_text += f"{item['number']}. **{item['name']}**\n"
+                parts.append(f"{item['number']}. **{item['name']}**")
+        response_text = "\n".join(parts) + "\n"
         
         return {
             "text": response_text,
@@ -196,12 +565,7 @@ def format_list_response(products: List[Dict], query_info: Dict, detailed: bool
         name = product.get('product_name', 'Unknown')
         
         # Get fees if available
-        attrs = product.get('attributes', {})
-        if isinstance(attrs, str):
-            try:
-                attrs = json.loads(attrs)
-            except:
-                attrs = {}
+        attrs = _get_attrs(product)
         
         fee = attrs.get('fees', '')
         
@@ -226,10 +590,11 @@ def format_list_response(products: List[Dict], query_info: Dict, detailed: bool
             else:
                 lines.append(f"{i}. **{name}**")
     
-    response_text = "\n".join(lines)
-    
     # Add helpful tip at the end
-    response_text += f"\n\n💡 _Ask \"explain [product name]\" for details on any specific product._"
+    lines.append("")
+    lines.append("💡 _Ask \"explain [product name]\" for details on any specific product._")
+    
+    response_text = "\n".join(lines)
     
     return {
         "text": response_text,
@@ -247,7 +612,83 @@ def format_list_response(products: List[Dict], query_info: Dict, detailed: bool
     }
 
 
-def format_explain_response(products: List[Dict], query_info: Dict, client: OpenAI) -> Dict[str, Any]:
+# Per-product EXPLAIN context blocks (LRU), keyed by (product_id, attrs_version):
+# upserts keep a product's id, bank, name and category and only change its
+# attributes, so a re-ingested product misses the cache.
+_PRODUCT_CONTEXT_CACHE_SIZE = 4096
+_product_context_cache: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+_product_context_lock = threading.Lock()
+
+
+def _product_context(product: Dict) -> str:
+    """Context block for one product (without the "Product N:" position prefix)"""
+    product_id = product.get('product_id')
+    key = (product_id, _attrs_version(product)) if product_id is not None else None
+    if key is not None:
+        with _product_context_lock:
+            cached = _product_context_cache.get(key)
+            if cached is not None:
+                _product_context_cache.move_to_end(key)
+                return cached
+    
+    attrs = _get_attrs(product)
+    block = f"""{product.get('product_name', 'Unknown')}
+- Bank: {product.get('bank_name', 'N/A')}
+- Category: {product.get('category', 'N/A')}
+- Fees: {attrs.get('fees', 'N/A')}
+- Features: {attrs.get('features', 'N/A')}
+- Eligibility: {attrs.get('eligibility', 'N/A')}
+- Interest Rate: {attrs.get('interest_rate', 'N/A')}""".strip()
+    
+    if key is not None:
+        with _product_context_lock:
+            _product_context_cache[key] = block
+            _product_context_cache.move_to_end(key)
+            if len(_product_context_cache) > _PRODUCT_CONTEXT_CACHE_SIZE:
+                _product_context_cache.popitem(last=False)
+    return block
+
+
+def _build_explain_context(products: List[Dict]) -> List[str]:
+    """Structured per-product context blocks for EXPLAIN prompts"""
+    return [f"Product {i}: {_product_context(product)}" for i, product in enumerate(products, 1)]
+
+
+def _build_explain_prompt(context_parts: List[str], query_info: Dict, allow_groups: bool = True) -> Optional[str]:
+    """
+    System prompt for an EXPLAIN request.
+    
+    Returns None when the products should be explained in parallel groups
+    (see _explain_in_groups) instead of one prompt.
+    """
+    count = len(context_parts)
+    full_context = "\n\n".join(context_parts)
+    original_query = query_info.get('original_query', '')
+    
+    # Determine if this is a single product explain or explain all
+    if query_info.get('product_name') or count == 1:
+        # Single product explanation
+        return _EXPLAIN_ONE_PROMPT_TMPL.format_map({
+            'full_context': full_context,
+            'original_query': original_query
+        })
+    
+    if allow_groups and count > EXPLAIN_GROUP_SIZE:
+        # Many products: fanned out per group in _explain_in_groups
+        return None
+    
+    # Multiple products explanation
+    return _EXPLAIN_ALL_PROMPT_TMPL.format_map({
+        'count': count,
+        'bank': query_info.get('bank', 'the bank'),
+        'category': query_info.get('category', 'products'),
+        'full_context': full_context,
+        'original_query': original_query
+    })
+
+
+def format_explain_response(products: List[Dict], query_info: Dict, client: OpenAI, llm_text: Optional[str] = None,
+                            on_delta: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
     """
     Format EXPLAIN query response using LLM with strict validation.
     
@@ -260,116 +701,42 @@ def format_explain_response(products: List[Dict], query_info: Dict, client: Open
         products: List of product dicts from database
         query_info: Classification info
         client: OpenAI client instance
+        llm_text: Already-generated LLM text (from format_count_and_explain); skips the LLM call
+        on_delta: Optional callback receiving streamed text chunks as they are generated
         
     Returns:
         Response dict with text, source, data, metadata
     """
     count = len(products)
-    
-    # Build structured context for LLM
-    context_parts = []
-    for i, product in enumerate(products, 1):
-        attrs = product.get('attributes', {})
-        if isinstance(attrs, str):
-            try:
-                attrs = json.loads(attrs)
-            except:
-                attrs = {}
-        
-        product_context = f"""
-Product {i}: {product.get('product_name', 'Unknown')}
-- Bank: {product.get('bank_name', 'N/A')}
-- Category: {product.get('category', 'N/A')}
-- Fees: {attrs.get('fees', 'N/A')}
-- Features: {attrs.get('features', 'N/A')}
-- Eligibility: {attrs.get('eligibility', 'N/A')}
-- Interest Rate: {attrs.get('interest_rate', 'N/A')}
-""".strip()
-        context_parts.append(product_context)
-    
-    full_context = "\n\n".join(context_parts)
-    
-    # Build prompt with strict instructions
-    bank = query_info.get('bank', 'the bank')
+    context_parts = _build_explain_context(products)
+    system_prompt = _build_explain_prompt(context_parts, query_info)
     category = query_info.get('category', 'products')
-    original_query = query_info.get('original_query', '')
-    product_name = query_info.get('product_name')
-    
-    # Determine if this is a single product explain or explain all
-    is_single_product = product_name or count == 1
-    
-    if is_single_product:
-        # Single product explanation
-        system_prompt = f"""You are explaining a specific banking product.
-
-PRODUCT DETAILS:
-{full_context}
-
-CRITICAL RULES:
-1. Explain ONLY this product in detail
-2. Include:
-   - Product name and bank
-   - Annual fees
-   - Key features (detailed)
-   - Eligibility criteria
-   - Interest rate (if applicable)
-3. Be accurate - ONLY use information provided above
-4. Do NOT mention other products
-5. Do NOT make up any information
-6. Be conversational and helpful
-
-User's question: "{original_query}"
-
-Provide a detailed explanation of this product."""
-    else:
-        # Multiple products explanation
-        system_prompt = f"""You are explaining {count} banking products from {bank}.
-
-PRODUCTS TO EXPLAIN:
-{full_context}
-
-CRITICAL RULES:
-1. Explain EVERY SINGLE product listed above - do not skip any
-2. Use numbered list format (1., 2., 3., ...)
-3. For each product, include:
-   - Product name as a heading
-   - Annual fees
-   - Key features (2-3 main points)
-   - Eligibility criteria
-   - Interest rate (if applicable)
-4. Be accurate - ONLY use information provided above
-5. Do NOT make up or assume any information
-6. Start your response with: "Here are ALL {count} {category}s with full details:"
-
-User's question: "{original_query}"
-
-Remember: You MUST include all {count} products in your response."""
     
     try:
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Explain all {count} {category}s"}
-            ],
-            model=LLM_MODEL,
-            temperature=0  # Maximum determinism
-        )
-        
-        response_text = response.choices[0].message.content
+        cache_key = _response_cache_key("EXPLAIN", products, query_info)
+        response_text = _cache_get(cache_key) if llm_text is None else _cache_set(cache_key, llm_text)
+        if llm_text is None and response_text is not None:
+            logging.info(f"[EXPLAIN] Response cache hit")
+        elif response_text is None and system_prompt is None:
+            response_text = _cache_set(cache_key, _explain_in_groups(client, context_parts, query_info, on_delta))
+        elif response_text is None:
+            response_text = _cache_set(cache_key, _complete(
+                client,
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": f"Explain all {count} {category}s"}
+                ],
+                temperature=0,  # Maximum determinism
+                on_delta=on_delta
+            ))
         
         # Validation: Check if all product names are mentioned
-        missing_products = []
-        for product in products:
-            product_name = product.get('product_name', '')
-            if product_name and product_name not in response_text:
-                missing_products.append(product_name)
+        missing_products = _find_missing_products(response_text, [p.get('product_name', '') for p in products])
         
         if missing_products:
             logging.warning(f"[EXPLAIN] LLM missed products: {missing_products}")
             # Append missing products
-            response_text += f"\n\n**Note:** The following products were not fully detailed above:\n"
-            for name in missing_products:
-                response_text += f"- {name}\n"
+            response_text = _with_missing_note(response_text, missing_products, "not fully detailed above")
         
         logging.info(f"[EXPLAIN] Generated explanation for {count} products")
         
@@ -399,6 +766,160 @@ Remember: You MUST include all {count} products in your response."""
         return format_list_response(products, query_info, detailed=True)
 
 
+def format_count_and_explain(products: List[Dict], query_info: Dict) -> Dict[str, Dict[str, Any]]:
+    """
+    Format COUNT + EXPLAIN for the same scope with ONE LLM call.
+    
+    Used when a multi-operation query needs both (e.g. "how many SBI cards, explain them"):
+    the model returns both texts as a JSON object, which are then validated by the
+    regular formatters. Falls back to two separate calls if the combined call fails.
+    
+    Returns:
+        {'COUNT': count_response_dict, 'EXPLAIN': explain_response_dict}
+    """
+    count = len(products)
+    if count == 0:
+        # Nothing to explain: the no-products text, without an LLM call
+        no_products = format_list_response(products, query_info)
+        no_products['metadata']['intent'] = 'EXPLAIN'
+        return {
+            'COUNT': format_count_response(products, query_info),
+            'EXPLAIN': no_products
+        }
+    
+    category = query_info.get('category', 'products')
+    original_query = query_info.get('original_query', '')
+    system_prompt = _COUNT_AND_EXPLAIN_PROMPT_TMPL.format_map({
+        'original_query': original_query,
+        'bank': query_info.get('bank', 'the bank'),
+        'category': category,
+        'count': count,
+        'full_context': "\n\n".join(_build_explain_context(products))
+    })
+    
+    try:
+        response = _client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": original_query or f"How many {category}s and explain them"}
+            ],
+            model=LLM_MODEL,
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+        payload = json.loads(response.choices[0].message.content)
+        count_text = payload.get('count_response')
+        explain_text = payload.get('explain_response')
+        if not count_text or not explain_text:
+            raise ValueError(f"missing keys in combined response: {list(payload.keys())}")
+        
+        logging.info(f"[COUNT+EXPLAIN] Generated both responses in one LLM call")
+        return {
+            'COUNT': format_count_response(products, query_info, llm_text=count_text),
+            'EXPLAIN': format_explain_response(products, query_info, _client, llm_text=explain_text)
+        }
+    
+    except Exception as e:
+        logging.warning(f"[COUNT+EXPLAIN] Combined call failed ({e}), formatting separately")
+        return {
+            'COUNT': format_count_response(products, query_info),
+            'EXPLAIN': format_explain_response(products, query_info, _client)
+        }
+
+
+def submit_explain_batch(jobs: List[Tuple[List[Dict], Dict]], client: Optional[OpenAI] = None) -> Optional[str]:
+    """
+    Queue EXPLAIN generations on the OpenAI Batch API (half the token cost,
+    separate rate limits, up to 24h turnaround).
+    
+    For non-interactive work such as pre-warming the response cache for popular
+    bank/category scopes. Each request's custom_id is its response-cache key, so
+    collect_explain_batch() can load the results straight into the cache.
+    
+    Args:
+        jobs: (products, query_info) pairs, as passed to format_explain_response
+        client: OpenAI client (defaults to the module client)
+        
+    Returns:
+        Batch id, or None if every job was already cached
+    """
+    client = client or _client
+    lines = []
+    queued = set()
+    
+    for products, query_info in jobs:
+        key = _response_cache_key("EXPLAIN", products, query_info)
+        with _response_cache_lock:
+            cached = key in _response_cache
+        if cached or key in queued:
+            continue
+        queued.add(key)
+        
+        context_parts = _build_explain_context(products)
+        category = query_info.get('category', 'products')
+        lines.append(json.dumps({
+            "custom_id": key,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": LLM_MODEL,
+                "temperature": 0,
+                "messages": [
+                    {"role": "system", "content": _build_explain_prompt(context_parts, query_info, allow_groups=False)},
+                    {"role": "user", "content": f"Explain all {len(products)} {category}s"}
+                ]
+            }
+        }))
+    
+    if not lines:
+        logging.info("[EXPLAIN Batch] All jobs already cached, nothing to submit")
+        return None
+    
+    batch_file = client.files.create(
+        file=("explain_batch.jsonl", "\n".join(lines).encode('utf-8')),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logging.info(f"[EXPLAIN Batch] Submitted {len(lines)} requests as batch {batch.id}")
+    return batch.id
+
+
+def collect_explain_batch(batch_id: str, client: Optional[OpenAI] = None) -> Optional[int]:
+    """
+    Load the results of a finished EXPLAIN batch into the response cache.
+    
+    Returns:
+        Number of responses cached, or None if the batch hasn't completed yet
+    """
+    client = client or _client
+    batch = client.batches.retrieve(batch_id)
+    
+    if batch.status != "completed":
+        logging.info(f"[EXPLAIN Batch] {batch_id} status: {batch.status}")
+        return None
+    if not batch.output_file_id:
+        return 0
+    
+    cached = 0
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get('response') or {}
+        if response.get('status_code') != 200:
+            logging.warning(f"[EXPLAIN Batch] {item.get('custom_id')} failed: {item.get('error')}")
+            continue
+        _cache_set(item['custom_id'], response['body']['choices'][0]['message']['content'])
+        cached += 1
+    
+    logging.info(f"[EXPLAIN Batch] Cached {cached} responses from batch {batch_id}")
+    return cached
+
+
 # For testing
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -18,12 +18,21 @@ Key Production Fixes:
 
 import re
 import json
+import hashlib
 import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, Optional, List, Tuple
 from openai import OpenAI
 
-from src.config import OPENAI_API_KEY, LLM_MODEL
-from src.vector_db import FAQVectorDB
+from src.config import OPENAI_API_KEY, LLM_MODEL, bank_matcher, find_banks
+
+# Module logger with lazy %-formatting: filtered records never build their message
+_logger = logging.getLogger(__name__)
 
 # =============================================================================
 # CONFIGURATION
@@ -32,60 +41,71 @@ from src.vector_db import FAQVectorDB
 # FAQ similarity threshold (lowered for better recall)
 FAQ_SIMILARITY_THRESHOLD = 0.40  # Lower threshold catches more FAQ matches
 
-# Dynamic bank list (fetched from DB)
-_supported_banks_cache = None
-_banks_cache_time = None
+# Dynamic bank/category lists (fetched from DB, refreshed every 5 minutes)
+CACHE_TTL_SECONDS = 300
+_refresh_lock = threading.Lock()
 
-def get_supported_banks(refresh: bool = False) -> List[str]:
-    """Get banks from database (with caching and refresh support)."""
-    global _supported_banks_cache, _banks_cache_time
-    import time
+
+class _TTLValue:
+    """
+    A single cached value that expires CACHE_TTL_SECONDS after it was set.
     
-    # Refresh cache if requested or older than 5 minutes
-    cache_stale = _banks_cache_time and (time.time() - _banks_cache_time > 300)
+    version only changes when a refresh returns different data, so it can key
+    downstream memoization cheaply.
+    """
+    __slots__ = ('value', 'expires_at', 'version')
     
-    if _supported_banks_cache is None or refresh or cache_stale:
-        try:
-            from src.database import DatabaseManager
-            db = DatabaseManager()
-            result = db.execute_raw_query(
-                "SELECT DISTINCT bank_name FROM products WHERE bank_name IS NOT NULL"
-            )
-            _supported_banks_cache = [row['bank_name'] for row in result]
-            _banks_cache_time = time.time()
-            if not _supported_banks_cache:
-                _supported_banks_cache = ['SBI', 'HDFC']  # Fallback
-        except:
-            _supported_banks_cache = ['SBI', 'HDFC']
-    return _supported_banks_cache
-
-
-# Dynamic category list (fetched from DB)
-_supported_categories_cache = None
-_categories_cache_time = None
+    def __init__(self):
+        self.value = None
+        self.expires_at = 0.0
+        self.version = 0
+    
+    def is_fresh(self) -> bool:
+        return self.value is not None and time.monotonic() < self.expires_at
+    
+    def set(self, value):
+        if value != self.value:
+            self.version += 1
+        self.value = value
+        self.expires_at = time.monotonic() + CACHE_TTL_SECONDS
+
+
+_banks_cache = _TTLValue()
+_categories_cache = _TTLValue()
+
+
+def _load_distinct(column: str, fallback: List[str]) -> List[str]:
+    """SELECT DISTINCT values of a products column, or the fallback if empty/unavailable."""
+    try:
+        from src.multi_retriever import get_db
+        # Shared connection: a refresh doesn't open (and re-initialize) a new one
+        db = get_db()
+        result = db.execute_raw_query(
+            f"SELECT DISTINCT {column} FROM products WHERE {column} IS NOT NULL"
+        )
+        return [row[column] for row in result] or fallback
+    except:
+        return fallback
+
+
+def _get_cached(cache: _TTLValue, column: str, fallback: List[str], refresh: bool) -> List[str]:
+    # Fast path is a single freshness check; only a miss takes the lock, and only
+    # one thread re-queries the DB while the others wait for its result
+    if refresh or not cache.is_fresh():
+        with _refresh_lock:
+            if refresh or not cache.is_fresh():
+                cache.set(_load_distinct(column, fallback))
+    return cache.value
+
+
+def get_supported_banks(refresh: bool = False) -> List[str]:
+    """Get banks from database (with caching and refresh support)."""
+    return _get_cached(_banks_cache, 'bank_name', ['SBI', 'HDFC'], refresh)
+
 
 def get_supported_categories(refresh: bool = False) -> List[str]:
     """Get categories from database (with caching and refresh support)."""
-    global _supported_categories_cache, _categories_cache_time
-    import time
-    
-    # Refresh cache if requested or older than 5 minutes
-    cache_stale = _categories_cache_time and (time.time() - _categories_cache_time > 300)
-    
-    if _supported_categories_cache is None or refresh or cache_stale:
-        try:
-            from src.database import DatabaseManager
-            db = DatabaseManager()
-            result = db.execute_raw_query(
-                "SELECT DISTINCT category FROM products WHERE category IS NOT NULL"
-            )
-            _supported_categories_cache = [row['category'] for row in result]
-            _categories_cache_time = time.time()
-            if not _supported_categories_cache:
-                _supported_categories_cache = ['Credit Card', 'Debit Card', 'Loan', 'Scheme']  # Fallback
-        except:
-            _supported_categories_cache = ['Credit Card', 'Debit Card', 'Loan', 'Scheme']
-    return _supported_categories_cache
+    return _get_cached(_categories_cache, 'category', ['Credit Card', 'Debit Card', 'Loan', 'Scheme'], refresh)
 
 
 def build_category_patterns(categories: List[str]) -> List[Tuple[str, str]]:
@@ -117,6 +137,41 @@ def build_category_patterns(categories: List[str]) -> List[Tuple[str, str]]:
     
     return patterns
 
+# Compiled matchers, rebuilt only when the bank/category caches above are refreshed
+# (keyed on the identity of the cached list, which is replaced on every refresh)
+_bank_matchers = None
+_category_matchers = None
+
+def get_bank_matchers() -> Tuple[Optional["re.Pattern"], List[Tuple[str, str]]]:
+    """
+    config.bank_matcher() for the current bank list (pass to config.find_banks).
+    """
+    global _bank_matchers
+    banks = get_supported_banks()
+    if _bank_matchers is None or _bank_matchers[0] is not banks:
+        _bank_matchers = (banks, bank_matcher(tuple(banks)))
+    return _bank_matchers[1]
+
+
+def get_category_matchers() -> Tuple[Optional["re.Pattern"], List[Tuple["re.Pattern", str]]]:
+    """
+    (any_category_re, [(compiled_pattern, category)]) for the current category list.
+    
+    any_category_re is every pattern in one alternation: a single search tells whether
+    ANY category is mentioned, so the priority-ordered list only runs on a hit.
+    """
+    global _category_matchers
+    categories = get_supported_categories()
+    if _category_matchers is None or _category_matchers[0] is not categories:
+        patterns = build_category_patterns(categories)
+        any_category_re = re.compile("|".join(f"(?:{p})" for p, _ in patterns)) if patterns else None
+        _category_matchers = (
+            categories,
+            any_category_re,
+            [(re.compile(pattern), cat) for pattern, cat in patterns]
+        )
+    return _category_matchers[1], _category_matchers[2]
+
 # Lazy initialization
 _vector_db = None
 _llm_client = None
@@ -124,7 +179,9 @@ _llm_client = None
 def _get_vector_db():
     global _vector_db
     if _vector_db is None:
-        _vector_db = FAQVectorDB()
+        # Same instance as the retrievers (one Chroma client and query cache)
+        from src.multi_retriever import get_vector_db
+        _vector_db = get_vector_db()
     return _vector_db
 
 def _get_llm_client():
@@ -177,6 +234,74 @@ GREETINGS = [
     'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening'
 ]
 
+# FAQ-like patterns (to avoid false CLARIFY)
+FAQ_PATTERNS = [
+    r'\b(how to|how do i|how can i|process|procedure|apply|document|eligibility|requirement|help)\b',
+    r'\b(what is|what are|kya hai|kaise)\b',
+    r'\b(create|open|activate|close|cancel|block)\s+(account|card|loan)\b',  # Account procedures
+]
+
+
+def _compile_any(patterns: List[str]) -> "re.Pattern":
+    """Collapse a pattern group into one alternation so each signal is a single .search()"""
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+# Compiled once at import
+# Keyword groups keep plain substring semantics: one search per group == any(kw in query)
+_COUNT_RE = _compile_any([re.escape(kw) for kw in COUNT_KEYWORDS])
+_LIST_RE = _compile_any([re.escape(kw) for kw in LIST_KEYWORDS])
+_RECOMMEND_RE = _compile_any([re.escape(kw) for kw in RECOMMEND_KEYWORDS])
+_COMPARE_RE = _compile_any(COMPARE_PATTERNS)
+_EXPLAIN_RE = _compile_any(EXPLAIN_PATTERNS)
+_EXPLAIN_ALL_RE = _compile_any(EXPLAIN_ALL_PATTERNS)
+_FAQ_RE = _compile_any(FAQ_PATTERNS)
+
+# Exact greeting, or a greeting followed by a space ("hi there")
+_GREETINGS_SET = frozenset(GREETINGS)
+_GREETING_PREFIX_RE = re.compile(r"(?:" + "|".join(re.escape(g) for g in GREETINGS) + r") ")
+
+# Stripped (in this order) from EXPLAIN queries to isolate a product name
+_PRODUCT_NAME_NOISE = ('explain', 'details', 'about', 'tell me', 'of', 'the')
+
+# Intent signals packed into one int (entities['sig']) for cheap combined tests
+SIG_COUNT = 1
+SIG_LIST = 2
+SIG_COMPARE = 4
+SIG_RECOMMEND = 8
+SIG_EXPLAIN = 16
+SIG_EXPLAIN_ALL = 32
+SIG_FAQ_PATTERN = 64
+SIG_GREETING = 128
+SIG_ACCURACY_CRITICAL = SIG_COUNT | SIG_LIST | SIG_EXPLAIN_ALL
+# Strong intents that rule out a vague single-term query
+SIG_NOT_VAGUE = SIG_COUNT | SIG_LIST | SIG_EXPLAIN | SIG_RECOMMEND
+
+
+def signal_mask(entities: Dict) -> int:
+    """entities['sig'], rebuilt from the boolean flags if a caller built the dict by hand"""
+    sig = entities.get('sig')
+    if sig is None:
+        sig = (
+            (SIG_COUNT if entities.get('has_count_signal') else 0) |
+            (SIG_LIST if entities.get('has_list_signal') else 0) |
+            (SIG_COMPARE if entities.get('has_compare_signal') else 0) |
+            (SIG_RECOMMEND if entities.get('has_recommend_signal') else 0) |
+            (SIG_EXPLAIN if entities.get('has_explain_signal') else 0) |
+            (SIG_EXPLAIN_ALL if entities.get('has_explain_all_signal') else 0) |
+            (SIG_FAQ_PATTERN if entities.get('has_faq_pattern') else 0) |
+            (SIG_GREETING if entities.get('is_greeting') else 0)
+        )
+    return sig
+
+# Bare product words that need a CLARIFY when asked without bank context
+VAGUE_TERMS = frozenset([
+    'loan', 'loans', 'credit', 'debit', 'card', 'cards',
+    'credit card', 'debit card', 'home loan', 'car loan',
+    'account', 'accounts', 'bank', 'banking', 'scheme', 'schemes'
+])
+_VAGUE_RE = _compile_any([re.escape(term) for term in sorted(VAGUE_TERMS)])
+
 
 
 
@@ -184,62 +309,70 @@ GREETINGS = [
 # STEP 1: ENTITY EXTRACTION (DB-Based)
 # =============================================================================
 
-def extract_entities(query: str) -> Dict:
+def extract_entities(query: str, query_lower: Optional[str] = None) -> Dict:
     """
     Extract entities from query using database values.
     
     Returns entity signals for routing decisions.
     Now extracts ALL banks for COMPARE queries.
+    query_lower may be passed when the caller already normalized the query.
     """
-    query_lower = query.lower().strip()
-    banks = get_supported_banks()
+    if query_lower is None:
+        query_lower = query.lower().strip()
+    get_supported_banks()
+    get_supported_categories()
+    entities = _extract_entities_cached(query_lower, _banks_cache.version, _categories_cache.version)
     
+    # Callers merge history state into the dict, so never hand out the cached one
+    result = dict(entities)
+    result['banks_found'] = list(entities['banks_found'])
+    return result
+
+
+@lru_cache(maxsize=8192)
+def _extract_entities_cached(query_lower: str, banks_version: int, categories_version: int) -> Dict:
+    """
+    Memoized extraction. The bank/category cache versions are part of the key, so a
+    refresh that changes either list automatically bypasses stale entries (without
+    building and hashing the full lists on every call).
+    """
     # Extract ALL banks from query (for COMPARE queries)
-    banks_found = []
-    for b in banks:
-        if b.lower() in query_lower:
-            banks_found.append(b)
+    # Keep the bank-list order (first listed bank is the primary one)
+    banks_found = find_banks(query_lower, get_bank_matchers())
     
     # Primary bank (first found) for backward compatibility
     bank = banks_found[0] if banks_found else None
     
     # Extract category - DYNAMIC from DB
     category = None
-    categories = get_supported_categories()
-    category_patterns = build_category_patterns(categories)
-    
-    for pattern, cat in category_patterns:
-        if re.search(pattern, query_lower):
-            category = cat
-            break
+    any_category_re, category_matchers = get_category_matchers()
+    if any_category_re is not None and any_category_re.search(query_lower):
+        # First pattern in priority order wins
+        for pattern, cat in category_matchers:
+            if pattern.search(query_lower):
+                category = cat
+                break
     
     # Detect intent signals (order matters for priority)
-    has_count = any(kw in query_lower for kw in COUNT_KEYWORDS)
-    has_compare = any(re.search(p, query_lower) for p in COMPARE_PATTERNS)
-    has_recommend = any(kw in query_lower for kw in RECOMMEND_KEYWORDS)
-    has_explain_all = any(re.search(p, query_lower) for p in EXPLAIN_ALL_PATTERNS)
-    has_explain = any(re.search(p, query_lower) for p in EXPLAIN_PATTERNS) and not has_explain_all
+    has_count = _COUNT_RE.search(query_lower) is not None
+    has_compare = _COMPARE_RE.search(query_lower) is not None
+    has_recommend = _RECOMMEND_RE.search(query_lower) is not None
+    has_explain_all = _EXPLAIN_ALL_RE.search(query_lower) is not None
+    has_explain = not has_explain_all and _EXPLAIN_RE.search(query_lower) is not None
     
     # LIST is only detected if no higher-priority intent is present
     has_list = (
-        any(kw in query_lower for kw in LIST_KEYWORDS) and 
         not has_count and 
         not has_compare and  # "compare all" should be COMPARE, not LIST
-        not has_recommend    # "best all" should be RECOMMEND, not LIST
+        not has_recommend and  # "best all" should be RECOMMEND, not LIST
+        _LIST_RE.search(query_lower) is not None
     )
     
     # Check for greeting
-    is_greeting = query_lower.strip() in GREETINGS or any(
-        query_lower == g or query_lower.startswith(g + ' ') for g in GREETINGS
-    )
+    is_greeting = query_lower in _GREETINGS_SET or _GREETING_PREFIX_RE.match(query_lower) is not None
     
     # Detect FAQ-like patterns (to avoid false CLARIFY)
-    faq_patterns = [
-        r'\b(how to|how do i|how can i|process|procedure|apply|document|eligibility|requirement|help)\b',
-        r'\b(what is|what are|kya hai|kaise)\b',
-        r'\b(create|open|activate|close|cancel|block)\s+(account|card|loan)\b',  # Account procedures
-    ]
-    has_faq_pattern = any(re.search(p, query_lower) for p in faq_patterns)
+    has_faq_pattern = _FAQ_RE.search(query_lower) is not None
     
     # Extract product name for EXPLAIN queries
     # Remove bank and category from query to isolate product name
@@ -247,7 +380,7 @@ def extract_entities(query: str) -> Dict:
     if has_explain or has_explain_all:
         # Remove common words and signals
         clean_query = query_lower
-        for word in ['explain', 'details', 'about', 'tell me', 'of', 'the']:
+        for word in _PRODUCT_NAME_NOISE:
             clean_query = clean_query.replace(word, ' ')
         
         # Remove bank name
@@ -265,7 +398,19 @@ def extract_entities(query: str) -> Dict:
         if len(product_name) < 3:
             product_name = None
     
+    sig = (
+        (SIG_COUNT if has_count else 0) |
+        (SIG_LIST if has_list else 0) |
+        (SIG_COMPARE if has_compare else 0) |
+        (SIG_RECOMMEND if has_recommend else 0) |
+        (SIG_EXPLAIN if has_explain else 0) |
+        (SIG_EXPLAIN_ALL if has_explain_all else 0) |
+        (SIG_FAQ_PATTERN if has_faq_pattern else 0) |
+        (SIG_GREETING if is_greeting else 0)
+    )
+    
     return {
+        'query_lower': query_lower,  # Normalized query, reused downstream instead of re-lowering
         'bank': bank,
         'banks_found': banks_found,  # All banks for COMPARE
         'category': category,
@@ -278,7 +423,8 @@ def extract_entities(query: str) -> Dict:
         'has_explain_all_signal': has_explain_all,
         'has_faq_pattern': has_faq_pattern,
         'is_greeting': is_greeting,
-        'is_accuracy_critical': has_count or has_list or has_explain_all
+        'is_accuracy_critical': bool(sig & SIG_ACCURACY_CRITICAL),
+        'sig': sig  # Same signals as a bitmask (SIG_*)
     }
 
 
@@ -303,36 +449,29 @@ def route_accuracy_critical(entities: Dict, query: str) -> Optional[Dict]:
     
     bank = entities['bank']
     category = entities['category']
-    query_lower = query.lower().strip()
+    query_lower = entities.get('query_lower') or query.lower().strip()
+    sig = signal_mask(entities)
     
     # GREETING - Always handle first
-    if entities['is_greeting']:
+    if sig & SIG_GREETING:
         return {'intent': 'GREETING', 'confidence': 0.99, 'path': 'GREETING'}
     
     # === VAGUE QUERY DETECTION ===
     # Single-word or very short banking terms should ask for clarification
     # BUT: Exclude queries with FAQ patterns (how to, apply, eligibility, etc.)
     # AND: Exclude if we have bank context from history!
-    vague_terms = [
-        'loan', 'loans', 'credit', 'debit', 'card', 'cards',
-        'credit card', 'debit card', 'home loan', 'car loan',
-        'account', 'accounts', 'bank', 'banking', 'scheme', 'schemes'
-    ]
-    
     # Only consider vague if:
     # - No FAQ pattern detected
     # - No bank context (from current query OR history)
     # - No strong intent signals
+    # (cheapest tests first; maxsplit bounds the token count at 3 pieces)
     is_vague = (
-        not entities.get('has_faq_pattern', False) and  # Skip if FAQ-like
         not bank and  # Skip if we have bank context (including from history!)
-        (query_lower in vague_terms or (
-            len(query_lower.split()) <= 2 and 
-            any(term in query_lower for term in vague_terms) and
-            not entities['has_count_signal'] and
-            not entities['has_list_signal'] and
-            not entities['has_explain_signal'] and
-            not entities['has_recommend_signal']
+        not sig & SIG_FAQ_PATTERN and  # Skip if FAQ-like
+        (query_lower in VAGUE_TERMS or (
+            not sig & SIG_NOT_VAGUE and
+            len(query_lower.split(None, 2)) <= 2 and
+            _VAGUE_RE.search(query_lower) is not None
         ))
     )
     
@@ -390,21 +529,21 @@ def route_accuracy_critical(entities: Dict, query: str) -> Optional[Dict]:
         }
     
     # COMPARE - Strict detection (fallback if evidence router didn't catch it)
-    if entities['has_compare_signal']:
+    if sig & SIG_COMPARE:
         return {'intent': 'COMPARE', 'confidence': 0.90, 'path': 'DB_SIGNALS'}
     
     # RECOMMEND (fallback)
-    if entities['has_recommend_signal']:
+    if sig & SIG_RECOMMEND:
         return {'intent': 'RECOMMEND', 'confidence': 0.90, 'path': 'DB_SIGNALS'}
     
     # EXPLAIN (single product/category) (fallback)
-    if entities['has_explain_signal']:
+    if sig & SIG_EXPLAIN:
         if bank or category:
             return {'intent': 'EXPLAIN', 'confidence': 0.85, 'path': 'DB_SIGNALS'}
     
     # Implicit LIST: bank + category without other signals (fallback)
     # BUT: Don't trigger for FAQ-like queries ("how to apply", "process", etc.)
-    if bank and category and not entities.get('has_faq_pattern', False):
+    if bank and category and not sig & SIG_FAQ_PATTERN:
         return {'intent': 'LIST', 'confidence': 0.70, 'path': 'IMPLICIT_LIST'}
     
     return None  # Not determinable from DB signals
@@ -415,13 +554,30 @@ def route_accuracy_critical(entities: Dict, query: str) -> Optional[Dict]:
 # STEP 3: FAQ SIMILARITY CHECK (Only for non-accuracy-critical)
 # =============================================================================
 
+_faq_count_cache = _TTLValue()
+
+
+def _faq_count() -> int:
+    """Number of FAQs in the vector store (TTL-cached)"""
+    if not _faq_count_cache.is_fresh():
+        try:
+            _faq_count_cache.set(_get_vector_db().collection.count())
+        except Exception:
+            return 1  # Unknown - let the real query decide
+    return _faq_count_cache.value
+
+
 def check_faq_similarity(query: str, bank: Optional[str] = None) -> Optional[Dict]:
     """
     Check FAQ similarity - ONLY for procedural queries.
     
-    Skipped entirely if query is accuracy-critical (COUNT/LIST/EXPLAIN_ALL).
+    Skipped entirely if query is accuracy-critical (COUNT/LIST/EXPLAIN_ALL),
+    and without embedding the query when the FAQ collection is empty.
     """
     try:
+        if not _faq_count():
+            return None
+        
         vector_db = _get_vector_db()
         results = vector_db.query_faqs(
             query,
@@ -434,7 +590,7 @@ def check_faq_similarity(query: str, bank: Optional[str] = None) -> Optional[Dic
             top_match = results[0]
             similarity = top_match.get('similarity', 0)
             
-            logging.debug(f"[FAQ] Match: {similarity:.3f}")
+            _logger.debug("[FAQ] Match: %.3f", similarity)
             
             if similarity >= FAQ_SIMILARITY_THRESHOLD:
                 return top_match
@@ -442,7 +598,7 @@ def check_faq_similarity(query: str, bank: Optional[str] = None) -> Optional[Dic
         return None
         
     except Exception as e:
-        logging.warning(f"[FAQ Check] Error: {e}")
+        _logger.warning("[FAQ Check] Error: %s", e)
         return None
 
 
@@ -450,27 +606,91 @@ def check_faq_similarity(query: str, bank: Optional[str] = None) -> Optional[Dic
 # STEP 4: LLM FALLBACK (Robust JSON Parsing)
 # =============================================================================
 
-def llm_classify(query: str, entities: Dict, chat_history: Optional[List] = None) -> Dict:
-    """
-    LLM classification for ambiguous queries with robust JSON parsing.
+# Concurrent LLM fallback calls in smart_route_many
+LLM_MAX_WORKERS = 8
+
+# llm_classify results keyed by a digest of the exact prompt, with the same TTL
+_llm_cache: Dict[bytes, Tuple[float, Dict]] = {}
+_llm_cache_lock = threading.Lock()
+
+
+# Local intent prototypes: seed phrasings embedded once with the FAQ embedding
+# model. Only history-independent intents are covered; FOLLOWUP and anything
+# ambiguous still go to the LLM.
+LOCAL_INTENT_EXAMPLES = {
+    'FAQ': [
+        "how do i apply", "what documents are required", "what is the process",
+        "how long does it take", "am i eligible", "how can i close my account",
+        "what are the charges", "how to block my card"
+    ],
+    'RECOMMEND': [
+        "which one should i choose", "suggest something for me", "what is best for students",
+        "which is good for travel", "recommend one for shopping", "what suits a salaried person"
+    ],
+    'GREETING': [
+        "hi there", "hello", "good morning", "hey how are you", "thanks", "thank you"
+    ],
+}
+LOCAL_INTENT_THRESHOLD = 0.75  # Min cosine similarity to trust the local label
+LOCAL_INTENT_MARGIN = 0.05     # Min lead over the runner-up intent
+
+_intent_prototypes = None  # (labels, unit-normalized example vectors)
+_intent_prototypes_lock = threading.Lock()
+
+
+def _embed(texts: List[str]) -> List[List[float]]:
+    """Embed and L2-normalize texts with the same model the FAQ collection uses"""
+    vectors = []
+    for vec in _get_vector_db().embedding_fn(texts):
+        vec = [float(x) for x in vec]
+        norm = sum(x * x for x in vec) ** 0.5 or 1.0
+        vectors.append([x / norm for x in vec])
+    return vectors
+
+
+def local_classify(query: str) -> Optional[Dict]:
     """
-    client = _get_llm_client()
-    
-    # Build history context
-    history_context = ""
-    if chat_history and len(chat_history) > 0:
-        recent = chat_history[-3:]
-        history_context = "\n".join([
-            f"- {msg.get('role', 'user')}: {msg.get('content', '')[:80]}"
-            for msg in recent
-        ])
+    Nearest-prototype intent classifier (no network).
     
-    prompt = f"""Classify this banking query into ONE intent.
+    Returns {'intent', 'confidence'} when the best intent is both similar enough
+    and clearly ahead of the runner-up, otherwise None.
+    """
+    global _intent_prototypes
+    try:
+        if _intent_prototypes is None:
+            with _intent_prototypes_lock:
+                if _intent_prototypes is None:
+                    labels = [intent for intent, examples in LOCAL_INTENT_EXAMPLES.items() for _ in examples]
+                    examples = [ex for exs in LOCAL_INTENT_EXAMPLES.values() for ex in exs]
+                    _intent_prototypes = (labels, _embed(examples))
+        
+        labels, vectors = _intent_prototypes
+        query_vec = _embed([query])[0]
+        
+        # Best example similarity (cosine) per intent
+        best = {}
+        for label, vec in zip(labels, vectors):
+            sim = sum(a * b for a, b in zip(vec, query_vec))
+            if sim > best.get(label, -1.0):
+                best[label] = sim
+        ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+        
+        intent, top = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if top >= LOCAL_INTENT_THRESHOLD and top - runner_up >= LOCAL_INTENT_MARGIN:
+            return {'intent': intent, 'confidence': round(top, 2)}
+    except Exception as e:
+        _logger.warning("[Local Classify] Error: %s", e)
+    return None
+
+
+# Classifier prompt, filled with str.format per call
+_LLM_CLASSIFY_PROMPT_TMPL = """Classify this banking query into ONE intent.
 
 Query: "{query}"
-Bank detected: {entities.get('bank', 'None')}
-Category detected: {entities.get('category', 'None')}
-Recent chat: {history_context if history_context else 'None'}
+Bank detected: {bank}
+Category detected: {category}
+Previous intent: {prev_intent}; Previous bank: {prev_bank}; Previous category: {prev_category}
 
 Intents (choose ONE):
 - FAQ: Asking about process, procedure, documents, how-to, eligibility
@@ -479,47 +699,167 @@ Intents (choose ONE):
 - GREETING: Just saying hello
 - UNKNOWN: Cannot determine
 
-Return ONLY valid JSON: {{"intent": "...", "confidence": 0.0-1.0}}"""
+Reply with ONLY the intent name."""
+
+# The LLM answers with a bare label, so a few output tokens are enough
+LLM_INTENTS = ('FAQ', 'RECOMMEND', 'FOLLOWUP', 'GREETING', 'UNKNOWN')
+LLM_INTENT_MAX_TOKENS = 5
+_INTENT_LABEL_RE = re.compile(r"\b(?:" + "|".join(LLM_INTENTS) + r")\b")
 
+
+def _label_confidence(choice) -> float:
+    """Probability of the first answer token, or a neutral 0.7 if logprobs are unavailable"""
+    try:
+        return round(math.exp(choice.logprobs.content[0].logprob), 2)
+    except Exception:
+        return 0.7
+
+
+def _parse_json_object(text: str) -> Optional[Dict]:
+    """
+    ROBUST JSON PARSING: clean JSON (the common case) costs one json.loads;
+    markdown fences / surrounding prose are only stripped when that fails.
+    """
+    try:
+        result = json.loads(text)
+        if isinstance(result, dict):
+            return result
+    except ValueError:
+        pass
+    
+    # Remove markdown code blocks
+    text = text.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    
+    # Find JSON object boundaries
+    start_idx = text.find('{')
+    end_idx = text.rfind('}') + 1
+    if start_idx >= 0 and end_idx > start_idx:
+        return json.loads(text[start_idx:end_idx])
+    return None
+
+
+def llm_classify(query: str, entities: Dict, state=None) -> Dict:
+    """
+    LLM classification for ambiguous queries with robust JSON parsing.
+    
+    Conversation context is the ContextState summary (previous intent/bank/
+    category) rather than raw chat messages, which keeps the prompt short.
+    A confident local prototype match is returned without calling the LLM.
+    """
+    local_result = local_classify(query)
+    if local_result:
+        _logger.info("[LLM Classify] Local match: %s (%.2f)", local_result['intent'], local_result['confidence'])
+        return local_result
+    
+    client = _get_llm_client()
+    
+    prompt = _LLM_CLASSIFY_PROMPT_TMPL.format(
+        query=query,
+        bank=entities.get('bank', 'None'),
+        category=entities.get('category', 'None'),
+        prev_intent=getattr(state, 'active_intent', None),
+        prev_bank=getattr(state, 'bank', None),
+        prev_category=getattr(state, 'category', None)
+    )
+
+    cache_key = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).digest()
+    with _llm_cache_lock:
+        entry = _llm_cache.get(cache_key)
+    if entry is not None and entry[0] > time.monotonic():
+        return dict(entry[1])
+    
     try:
         response = client.chat.completions.create(
             model=LLM_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.0,
-            max_tokens=50
+            max_tokens=LLM_INTENT_MAX_TOKENS,
+            logprobs=True
         )
         
-        result_text = response.choices[0].message.content.strip()
-        
-        # ROBUST JSON PARSING
-        # Remove markdown code blocks
-        result_text = re.sub(r'^```json?\s*', '', result_text)
-        result_text = re.sub(r'\s*```$', '', result_text)
-        result_text = result_text.strip()
+        choice = response.choices[0]
+        result_text = choice.message.content.strip()
         
-        # Find JSON object boundaries
-        start_idx = result_text.find('{')
-        end_idx = result_text.rfind('}') + 1
+        classified = None
+        if result_text.startswith('{'):
+            # Model answered in the old JSON shape anyway
+            result = _parse_json_object(result_text)
+            if result is not None:
+                classified = {
+                    'intent': result.get('intent', 'UNKNOWN'),
+                    'confidence': float(result.get('confidence', 0.5))
+                }
+        else:
+            label = _INTENT_LABEL_RE.search(result_text.upper())
+            if label:
+                classified = {'intent': label.group(0), 'confidence': _label_confidence(choice)}
         
-        if start_idx >= 0 and end_idx > start_idx:
-            json_str = result_text[start_idx:end_idx]
-            result = json.loads(json_str)
-            return {
-                'intent': result.get('intent', 'UNKNOWN'),
-                'confidence': float(result.get('confidence', 0.5))
-            }
+        if classified is not None:
+            with _llm_cache_lock:
+                if len(_llm_cache) >= _ROUTE_CACHE_SIZE:
+                    _llm_cache.clear()
+                _llm_cache[cache_key] = (time.monotonic() + CACHE_TTL_SECONDS, classified)
+            return dict(classified)
         
         return {'intent': 'UNKNOWN', 'confidence': 0.3}
         
     except Exception as e:
-        logging.warning(f"[LLM Classify] Error: {e}")
+        _logger.warning("[LLM Classify] Error: %s", e)
         return {'intent': 'UNKNOWN', 'confidence': 0.3}
 
 
+# =============================================================================
+# ROUTE CACHE
+# =============================================================================
+
+# Repeated (query, conversation state) pairs skip the whole pipeline. Entries
+# expire with the bank/category caches so DB changes are picked up.
+_ROUTE_CACHE_SIZE = 4096
+_route_cache = OrderedDict()  # key -> (expires_at, (query, result))
+_route_cache_lock = threading.Lock()
+
+
+def _route_cache_key(query_lower: str, state) -> Tuple[str, str]:
+    """Normalized query + the history state that routing actually depends on"""
+    return query_lower, json.dumps(state.to_dict(), sort_keys=True, default=str)
+
+
+def _route_cache_get(key: Tuple[str, str]) -> Optional[Tuple[str, Dict]]:
+    with _route_cache_lock:
+        entry = _route_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _route_cache[key]
+            return None
+        _route_cache.move_to_end(key)
+        return entry[1]
+
+
+def _route_cache_set(key: Tuple[str, str], entry: Tuple[str, Dict]):
+    with _route_cache_lock:
+        _route_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, entry)
+        _route_cache.move_to_end(key)
+        if len(_route_cache) > _ROUTE_CACHE_SIZE:
+            _route_cache.popitem(last=False)
+
+
+def clear_route_cache():
+    """Drop cached routing decisions (e.g. after re-ingestion)"""
+    with _route_cache_lock:
+        _route_cache.clear()
+    with _llm_cache_lock:
+        _llm_cache.clear()
+
+
 # =============================================================================
 # MAIN ROUTER
 # =============================================================================
 
+# Runs entity extraction alongside history-state reconstruction in smart_route
+_prep_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="smart-router")
+
+
 def smart_route(query: str, chat_history: Optional[List] = None) -> Dict:
     """
     Production-safe hybrid router.
@@ -543,45 +883,83 @@ def smart_route(query: str, chat_history: Optional[List] = None) -> Dict:
             'clarify_message': str or None  # For CLARIFY intent
         }
     """
-    logging.info(f"[SmartRouter] Processing: {query}")
+    _logger.info("[SmartRouter] Processing: %s", query)
     
     # === STEP 0: Extract context from chat history (State Machine) ===
     from src.history_manager import HistoryStateManager
-    from src.followup_router import FollowupRouter
+    
+    # Normalized once; shared by entity extraction, the route cache and (via
+    # entities['query_lower']) route_accuracy_critical
+    query_lower = query.lower().strip()
+    
+    # Entity extraction doesn't depend on history, so it overlaps state reconstruction
+    entities_future = _prep_pool.submit(extract_entities, query, query_lower)
     
     # 1. Reconstruct State
     history_manager = HistoryStateManager()
     state = history_manager.extract_state(chat_history)
     
+    cache_key = _route_cache_key(query_lower, state)
+    cached = _route_cache_get(cache_key)
+    if cached is not None:
+        cached_query, cached_result = cached
+        _logger.info("[SmartRouter] Cache hit: %s", cached_result['intent'])
+        result = dict(cached_result)
+        # Echo this call's wording, but keep virtual queries from followup transitions
+        if result.get('original_query') == cached_query:
+            result['original_query'] = query
+        return result
+    
+    result, entities = _route_without_llm(query, state, entities_future.result())
+    
+    if result is None:
+        # LLM fallback has its own prompt-level cache (successful classifications only)
+        return _llm_fallback_result(query, entities, state)
+    
+    _route_cache_set(cache_key, (query, dict(result)))
+    return result
+
+
+def _route_without_llm(query: str, state, entities: Optional[Dict] = None) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Routing steps 0.2-3 given the reconstructed history state (and, optionally,
+    entities already extracted from the query).
+    
+    Returns (result, entities); result is None when the query needs the LLM fallback.
+    """
+    from src.followup_router import FollowupRouter
+    
     # 2. Check for Specific Follow-up Transitions
     followup_router = FollowupRouter()
     followup_result = followup_router.route_followup(query, state)
     
     if followup_result:
-        logging.info(f"[SmartRouter] Followup Transition: {followup_result['routing_path']}")
-        return followup_result  # Return immediately (Virtual Query Strategy)
+        _logger.info("[SmartRouter] Followup Transition: %s", followup_result['routing_path'])
+        return followup_result, None  # Return immediately (Virtual Query Strategy)
     
     # === STEP 1: Entity Extraction from current query ===
-    entities = extract_entities(query)
+    if entities is None:
+        entities = extract_entities(query)
     
     # === MERGE: Fill missing entities from history state ===
     # If current query doesn't have bank/category, use persistent state
     if not entities['bank'] and state.bank:
         entities['bank'] = state.bank
         entities['banks_found'] = [state.bank]
-        logging.info(f"[Context] Using bank from history: {entities['bank']}")
+        _logger.info("[Context] Using bank from history: %s", entities['bank'])
     
     if not entities['category'] and state.category:
         entities['category'] = state.category
-        logging.info(f"[Context] Using category from history: {entities['category']}")
+        _logger.info("[Context] Using category from history: %s", entities['category'])
     
-    logging.debug(f"[Step 1] Entities (merged): {entities}")
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug("[Step 1] Entities (merged): %r", entities)
     
     # === STEP 2: Accuracy-Critical Routing (HIGHEST PRIORITY) ===
     critical_result = route_accuracy_critical(entities, query)
     if critical_result:
         intent = critical_result['intent']
-        logging.info(f"[Step 2] Accuracy-critical: {intent} ({critical_result['confidence']:.2f})")
+        _logger.info("[Step 2] Accuracy-critical: %s (%.2f)", intent, critical_result['confidence'])
         return {
             'intent': intent,
             'confidence': critical_result['confidence'],
@@ -596,14 +974,14 @@ def smart_route(query: str, chat_history: Optional[List] = None) -> Dict:
             'clarify_message': critical_result.get('clarify_message'),
             'evidence': critical_result.get('evidence'),
             'scope': critical_result.get('scope')
-        }
+        }, entities
     
     # === STEP 3: FAQ Similarity (Only for non-accuracy-critical) ===
-    # Skip if we detected strong DB signals
-    if not entities['is_accuracy_critical']:
+    # Skip if we detected strong DB signals (COMPARE/RECOMMEND never resolve to a FAQ)
+    if not signal_mask(entities) & (SIG_ACCURACY_CRITICAL | SIG_COMPARE | SIG_RECOMMEND):
         faq_match = check_faq_similarity(query, entities.get('bank'))
         if faq_match:
-            logging.info(f"[Step 3] FAQ Match: {faq_match.get('similarity', 0):.3f}")
+            _logger.info("[Step 3] FAQ Match: %.3f", faq_match.get('similarity', 0))
             return {
                 'intent': 'FAQ',
                 'confidence': 0.90,
@@ -614,11 +992,15 @@ def smart_route(query: str, chat_history: Optional[List] = None) -> Dict:
                 'faq_match': faq_match,
                 'original_query': query,
                 'clarify_message': None
-            }
+            }, entities
     
-    # === STEP 4: LLM Fallback ===
-    logging.info("[Step 4] Using LLM fallback...")
-    llm_result = llm_classify(query, entities, chat_history)
+    return None, entities
+
+
+def _llm_fallback_result(query: str, entities: Dict, state) -> Dict:
+    """STEP 4: LLM Fallback"""
+    _logger.info("[Step 4] Using LLM fallback...")
+    llm_result = llm_classify(query, entities, state)
     
     return {
         'intent': llm_result['intent'],
@@ -633,6 +1015,75 @@ def smart_route(query: str, chat_history: Optional[List] = None) -> Dict:
     }
 
 
+def smart_route_many(queries: List[str], chat_histories: Optional[List[Optional[List]]] = None) -> List[Dict]:
+    """
+    Route a batch of queries (e.g. concurrent sessions or a test sweep).
+    
+    Steps 0-3 are cheap and run in order; only the queries that fall through to
+    the LLM fallback are classified concurrently, so N ambiguous queries cost
+    roughly one LLM round-trip instead of N.
+    """
+    from src.history_manager import HistoryStateManager
+    
+    if chat_histories is None:
+        chat_histories = [None] * len(queries)
+    
+    history_manager = HistoryStateManager()
+    results: List[Optional[Dict]] = [None] * len(queries)
+    needs_llm = []  # (index, entities, state)
+    
+    for i, (query, chat_history) in enumerate(zip(queries, chat_histories)):
+        state = history_manager.extract_state(chat_history)
+        query_lower = query.lower().strip()
+        cache_key = _route_cache_key(query_lower, state)
+        cached = _route_cache_get(cache_key)
+        if cached is not None:
+            cached_query, cached_result = cached
+            result = dict(cached_result)
+            if result.get('original_query') == cached_query:
+                result['original_query'] = query
+            results[i] = result
+            continue
+        
+        result, entities = _route_without_llm(query, state, extract_entities(query, query_lower))
+        if result is None:
+            needs_llm.append((i, entities, state))
+        else:
+            _route_cache_set(cache_key, (query, dict(result)))
+            results[i] = result
+    
+    if needs_llm:
+        _logger.info("[SmartRouter] LLM fallback for %d/%d queries (concurrent)", len(needs_llm), len(queries))
+        with ThreadPoolExecutor(max_workers=min(LLM_MAX_WORKERS, len(needs_llm))) as executor:
+            futures = {
+                i: executor.submit(_llm_fallback_result, queries[i], entities, state)
+                for i, entities, state in needs_llm
+            }
+            for i, future in futures.items():
+                results[i] = future.result()
+    
+    return results
+
+
+def warm_caches(background: bool = True):
+    """
+    Prime the bank/category lists and matchers so the first query skips the DB round-trip.
+    Call from app startup; importing this module never touches the DB.
+    """
+    def _warm():
+        try:
+            get_bank_matchers()
+            get_category_matchers()
+        except Exception as e:
+            _logger.debug("[SmartRouter] Cache warm-up failed: %s", e)
+    
+    if background:
+        # Non-blocking: startup continues while the DB is queried in the background
+        threading.Thread(target=_warm, name="smart-router-warmup", daemon=True).start()
+    else:
+        _warm()
+
+
 # =============================================================================
 # TESTING
 # =============================================================================
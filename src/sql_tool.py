@@ -1,27 +1,196 @@
 import os
 import sys
 import json
+import hashlib
+import atexit
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 import re
+import string
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from openai import OpenAI
-from src.database import DatabaseManager
+from src.database import (
+    MATERIALIZED_VIEWS, TRAVEL_MASK,
+    parse_attributes, fee_number, feature_mask
+)
 from src.config import (
-    OPENAI_API_KEY, LLM_MODEL,
+    OPENAI_API_KEY, LLM_MODEL, CHROMADB_DIR, DETAIL_LEVEL_LLM_FALLBACK,
     SUPPORTED_BANKS, PRODUCT_CATEGORIES,
-    get_bank_list_sql
+    get_bank_list_sql, bank_matcher, find_banks
 )
 
 client = OpenAI(api_key=OPENAI_API_KEY)
-db = DatabaseManager()
+
+
+def _get_db():
+    """Shared DatabaseManager, opened on first query rather than at import"""
+    from src.multi_retriever import get_db
+    return get_db()
+
+
+# Overlaps the detail-level classification with SQL generation
+_executor = ThreadPoolExecutor(max_workers=4)
+
+# Caps in-flight OpenAI calls from this module across concurrent requests
+LLM_MAX_CONCURRENT = 10
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENT)
+
+# === DETAIL-LEVEL RULES ===
+# Checked in priority order COUNT -> DETAIL -> LIST; the LLM is only asked
+# when none of them fire
+_DETAIL_LEVEL_RULES = [
+    (re.compile(r'\b(?:how many|count|number of|total\s+\w+)\b'), 'COUNT_ONLY'),
+    (re.compile(r'\b(?:explain|detail(?:s|ed)?|describe|tell me everything|fully|full)\b'), 'EXPLAIN_DETAILED'),
+    (re.compile(r'\b(?:list|what are|which|show me)\b'), 'LIST_BRIEF'),
+]
+
+
+# === DETAIL-LEVEL CACHE ===
+# Tier 1: exact LRU on the normalized query (functools.lru_cache below)
+# Tier 2: semantic - near-duplicate queries (cosine >= threshold) reuse the label.
+# Tier 2 is persisted so it survives restarts: vectors as .npy (loaded with
+# allow_pickle=False) plus a JSON label list, flushed in batches and at exit.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+SEMANTIC_CACHE_FLUSH_EVERY = 25  # new entries between writes
+SEMANTIC_CACHE_VECTORS_PATH = os.path.join(str(CHROMADB_DIR), "classify_cache.npy")
+SEMANTIC_CACHE_LABELS_PATH = os.path.join(str(CHROMADB_DIR), "classify_cache_labels.json")
+
+_semantic_cache = None  # {'vectors': np.ndarray (n, d), 'labels': [str]}
+_semantic_cache_dirty = 0  # entries stored since the last flush
+_semantic_cache_lock = threading.Lock()
+
+
+def _embed_query(text):
+    """Unit-normalized embedding with the shared FAQ embedding model"""
+    import numpy as np
+    from src.multi_retriever import get_vector_db
+    vec = np.asarray(get_vector_db().embedding_fn([text])[0], dtype=np.float32)
+    return vec / max(float(np.linalg.norm(vec)), 1e-12)
+
+
+def _load_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = {'vectors': None, 'labels': []}
+        try:
+            import numpy as np
+            vectors = np.load(SEMANTIC_CACHE_VECTORS_PATH, allow_pickle=False)
+            with open(SEMANTIC_CACHE_LABELS_PATH, 'r', encoding='utf-8') as f:
+                labels = json.load(f)
+            # A crash between the two writes can leave them out of step
+            if vectors.ndim == 2 and isinstance(labels, list) and len(labels) == len(vectors):
+                _semantic_cache = {'vectors': vectors.astype(np.float32, copy=False), 'labels': labels}
+        except Exception:
+            pass
+    return _semantic_cache
+
+
+def _flush_semantic_cache():
+    """Write the semantic cache to disk (caller holds _semantic_cache_lock)"""
+    global _semantic_cache_dirty
+    if not _semantic_cache_dirty or _semantic_cache is None or _semantic_cache['vectors'] is None:
+        return
+    import numpy as np
+    try:
+        with open(SEMANTIC_CACHE_VECTORS_PATH, 'wb') as f:
+            np.save(f, _semantic_cache['vectors'], allow_pickle=False)
+        with open(SEMANTIC_CACHE_LABELS_PATH, 'w', encoding='utf-8') as f:
+            json.dump(_semantic_cache['labels'], f)
+        _semantic_cache_dirty = 0
+    except OSError as e:
+        logging.warning(f"[SQL Tool] Could not persist classify cache: {e}")
+
+
+@atexit.register
+def _flush_semantic_cache_at_exit():
+    with _semantic_cache_lock:
+        _flush_semantic_cache()
+
+
+def _semantic_lookup(query_vec):
+    """Label of the most similar cached query, if similar enough"""
+    with _semantic_cache_lock:
+        cache = _load_semantic_cache()
+        if cache['vectors'] is None or not cache['labels']:
+            return None
+        sims = cache['vectors'] @ query_vec
+        best = int(sims.argmax())
+        if sims[best] >= SEMANTIC_CACHE_THRESHOLD:
+            return cache['labels'][best]
+    return None
+
+
+def _semantic_store(query_vec, label):
+    global _semantic_cache_dirty
+    import numpy as np
+    with _semantic_cache_lock:
+        cache = _load_semantic_cache()
+        row = query_vec.reshape(1, -1)
+        vectors = row if cache['vectors'] is None else np.vstack([cache['vectors'], row])
+        labels = cache['labels'] + [label]
+        if len(labels) > SEMANTIC_CACHE_MAX_ENTRIES:
+            vectors, labels = vectors[-SEMANTIC_CACHE_MAX_ENTRIES:], labels[-SEMANTIC_CACHE_MAX_ENTRIES:]
+        cache['vectors'], cache['labels'] = vectors, labels
+        _semantic_cache_dirty += 1
+        if _semantic_cache_dirty >= SEMANTIC_CACHE_FLUSH_EVERY:
+            _flush_semantic_cache()
+
 
 def classify_query_detail_level(user_query):
     """
-    Uses LLM to classify how detailed the user wants the response.
+    Classifies how detailed the user wants the response.
     Returns: 'COUNT_ONLY', 'LIST_BRIEF', or 'EXPLAIN_DETAILED'
+    
+    Keyword rules answer the common phrasings directly. Otherwise the result is
+    cached on the normalized query; near-duplicates are served from the
+    semantic cache before falling back to the LLM (unless
+    DETAIL_LEVEL_LLM_FALLBACK is off, in which case LIST_BRIEF is used).
+    """
+    query_norm = user_query.strip().lower()
+    for pattern, label in _DETAIL_LEVEL_RULES:
+        if pattern.search(query_norm):
+            return label
+    
+    if not DETAIL_LEVEL_LLM_FALLBACK:
+        return 'LIST_BRIEF'
+    
+    try:
+        return _classify_detail_level_cached(query_norm)
+    except LookupError:
+        # LLM failed or was unclear (not cached, so the next call retries)
+        return 'LIST_BRIEF'
+
+
+@lru_cache(maxsize=1024)
+def _classify_detail_level_cached(user_query):
+    query_vec = None
+    try:
+        query_vec = _embed_query(user_query)
+        label = _semantic_lookup(query_vec)
+        if label:
+            return label
+    except Exception as e:
+        logging.debug(f"[SQL Tool] Semantic cache unavailable: {e}")
+    
+    label = _llm_classify_detail_level(user_query)
+    if label is None:
+        raise LookupError(user_query)
+    if query_vec is not None:
+        _semantic_store(query_vec, label)
+    return label
+
+
+def _llm_classify_detail_level(user_query):
+    """
+    Uses LLM to classify the detail level.
+    Returns the label, or None if the call failed / answer was unclear.
     """
     classification_prompt = f"""
     Classify the user's query into one of these detail levels:
@@ -41,42 +210,216 @@ def classify_query_detail_level(user_query):
     """
     
     try:
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": classification_prompt}],
-            model=LLM_MODEL,
-            temperature=0.0,
-            max_tokens=10
-        )
+        with _llm_slots:
+            response = client.chat.completions.create(
+                messages=[{"role": "user", "content": classification_prompt}],
+                model=LLM_MODEL,
+                temperature=0.0,
+                max_tokens=10
+            )
         classification = response.choices[0].message.content.strip().upper()
         
-        # Validate and default to LIST_BRIEF if unclear
+        # Unclear answers aren't cached; caller defaults to LIST_BRIEF
         if classification not in ['COUNT_ONLY', 'LIST_BRIEF', 'EXPLAIN_DETAILED']:
-            return 'LIST_BRIEF'
+            return None
         return classification
     except Exception as e:
-        # Fallback to LIST_BRIEF on error
-        return 'LIST_BRIEF'
+        # Caller falls back to LIST_BRIEF on error
+        return None
 
 
-def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
-    """
-    Uses LLM to generate SQL query based on user question and history,
-    executes it against the products database.
+# === CONTEXT BANK DETECTION ===
+# Whole-word bank mentions in one scan, matched the same way as the router
+# and history parser (config.bank_matcher)
+_BANK_MATCHER = bank_matcher(tuple(SUPPORTED_BANKS))
+
+
+def _banks_mentioned(msg_lower):
+    """Distinct banks mentioned (as whole words) in the lowercased message, in SUPPORTED_BANKS order"""
+    return find_banks(msg_lower, _BANK_MATCHER)
+
+
+# === RECOMMENDATIONS ===
+def _recommendation_persona(query_lower):
+    """'student' / 'travel' / 'premium' for a recommendation query, None otherwise"""
+    if 'student' in query_lower or 'low income' in query_lower:
+        return 'student'
+    if 'travel' in query_lower or 'fly' in query_lower or 'lounge' in query_lower or 'flyer' in query_lower:
+        return 'travel'
+    if 'premium' in query_lower or 'luxury' in query_lower:
+        return 'premium'
+    return None
+
+
+def _is_direct_recommendation(query_lower):
+    """Queries answered with the top-3 list formatted in Python (no synthesis)"""
+    return (
+        'best' in query_lower and ('for' in query_lower or 'card' in query_lower or 'loan' in query_lower) or
+        'recommend' in query_lower or
+        'which bank' in query_lower
+    )
+
+
+# Persona -> (header, rationale) for the top-3 answer; keys match MATERIALIZED_VIEWS.
+# None is used when no persona filter was applied.
+RECOMMENDATION_TEXT = {
+    'student': ("Best Credit Cards for Students", "Lowest fees suitable for students (under Rs. 1000)."),
+    'travel': ("Best Credit Cards for Travel", "Cards with travel benefits (lounge access, airline miles), lowest fees first."),
+    'premium': ("Best Premium Credit Cards", "Premium cards (annual fee Rs. 2000 and above), lowest fees first."),
+    None: ("Top Recommendations", "Lowest fees first."),
+}
+
+
+def _format_recommendation(top_3, candidate_count, persona=None):
+    """Top-3 answer for a recommendation query (cards as dicts)"""
+    header, rationale = RECOMMENDATION_TEXT.get(persona, RECOMMENDATION_TEXT[None])
+    response_text = f"**{header}:**\n\n"
     
-    Args:
-        user_query: The user's question
-        chat_history: Conversation context for context-aware filtering
-        skip_synthesis: If True, skip GPT synthesis and return only data (saves ~1.5s)
+    medals = ["🥇 **Best Choice**", "🥈 **Alternative**", "💰 **Budget Option**"]
+    for i, card in enumerate(top_3):
+        attrs = parse_attributes(card.get('attributes', '{}'))
+        
+        response_text += f"{medals[i]}: **{card.get('product_name', 'Unknown')}**\n"
+        response_text += f"- Bank: {card.get('bank_name', 'N/A')}\n"
+        response_text += f"- Fees: {attrs.get('fees', 'N/A')}\n"
+        response_text += f"- Features: {attrs.get('features', 'N/A')}\n"
+        response_text += f"- Eligibility: {attrs.get('eligibility', 'N/A')}\n\n"
     
-    Returns:
-        dict: {
-            "text": "Natural language response..." (if skip_synthesis=False),
-            "data": [row_dict_1, ...], # List of dicts
-            "sql": "SELECT ...",
-            "source": "SQL Product Catalog"
-        }
+    response_text += f"**Why these?** {rationale} "
+    response_text += f"We filtered {candidate_count} options and selected the top 3 by affordability."
+    return response_text
+
+
+# Single-row results shorter than this are formatted without synthesis
+SINGLE_ROW_MAX_CHARS = 400
+
+
+def _format_single_product(row):
+    """Answer for a single-product lookup (same layout as the recommendation entries)"""
+    attrs = parse_attributes(row.get('attributes', '{}'))
+    
+    response_text = f"**{row.get('product_name', 'Unknown')}**\n"
+    response_text += f"- Bank: {row.get('bank_name', 'N/A')}\n"
+    if row.get('category'):
+        response_text += f"- Category: {row['category']}\n"
+    response_text += f"- Fees: {attrs.get('fees', 'N/A')}\n"
+    if attrs.get('interest_rate'):
+        response_text += f"- Interest Rate: {attrs['interest_rate']}\n"
+    response_text += f"- Features: {attrs.get('features', 'N/A')}\n"
+    response_text += f"- Eligibility: {attrs.get('eligibility', 'N/A')}\n"
+    return response_text
+
+
+def _recommend_from_materialized_view(query_lower):
+    """
+    Answer persona card recommendations ("best credit card for students") straight
+    from the precomputed mv_* tables, skipping SQL generation.
+    Returns None when the query isn't a plain persona card recommendation.
     """
+    if not _is_direct_recommendation(query_lower) or 'card' not in query_lower or 'debit' in query_lower:
+        return None
+    if 'home' in query_lower and 'loan' in query_lower:
+        return None
+    persona = _recommendation_persona(query_lower)
+    banks = _banks_mentioned(query_lower)
+    if not persona or len(banks) > 1:
+        return None
     
+    table, _ = MATERIALIZED_VIEWS[persona]
+    where = " WHERE bank_name = ?" if banks else ""
+    sql_query = f"SELECT *, COUNT(*) OVER () AS candidate_count FROM {table}{where} ORDER BY fees_num, product_name LIMIT 3"
+    try:
+        cards = _get_db().execute_raw_query(sql_query, banks)
+    except Exception as e:
+        logging.warning(f"[SQL Tool] Materialized view {table} unavailable: {e}")
+        return None
+    
+    # Same threshold as the row filter: fewer than 2 matches falls back to generated SQL
+    if len(cards) < 2:
+        return None
+    
+    candidate_count = cards[0]['candidate_count']
+    for card in cards:
+        del card['candidate_count']
+    
+    logging.info(f"[SQL Tool] Recommendation served from {table} ({candidate_count} candidates)")
+    return {
+        "text": _format_recommendation(cards, candidate_count, persona),
+        "data": cards,
+        "sql": sql_query,
+        "source": "Product Catalog (SQL)"
+    }
+
+
+# === GENERATED-SQL CACHE ===
+# LRU of SQL text keyed by the normalized query and the context filters that
+# shape the generation prompt
+SQL_CACHE_SIZE = 2048
+_sql_cache = OrderedDict()
+_sql_cache_lock = threading.Lock()
+
+
+def _sql_cache_key(user_query, bank_filter, category_filter, product_filter):
+    raw = f"{user_query.lower().strip()}|{bank_filter}|{category_filter}|{product_filter}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _sql_cache_get(key):
+    with _sql_cache_lock:
+        sql_query = _sql_cache.get(key)
+        if sql_query is not None:
+            _sql_cache.move_to_end(key)
+        return sql_query
+
+
+def _sql_cache_set(key, sql_query):
+    with _sql_cache_lock:
+        _sql_cache[key] = sql_query
+        _sql_cache.move_to_end(key)
+        if len(_sql_cache) > SQL_CACHE_SIZE:
+            _sql_cache.popitem(last=False)
+
+
+_COUNT_SQL_RE = re.compile(r'\bCOUNT\s*\(', re.IGNORECASE)
+
+
+def _count_response(sql_query, column_name, actual_count):
+    """Answer for a query whose result is a single count value"""
+    count_response = f"{column_name.replace('COUNT(*)', 'Count').replace('_', ' ').title()}: {actual_count}"
+    return {
+        "text": count_response,
+        "data": [{column_name: actual_count}],
+        "sql": sql_query,
+        "source": "Product Catalog (SQL)"
+    }
+
+
+def _rows_to_dicts(cursor):
+    """(column names, rows as dicts) from an executed cursor in one pass"""
+    column_names = [desc[0] for desc in cursor.description] if cursor.description else []
+    return column_names, [dict(row) for row in cursor]
+
+
+# === SQL GENERATION PROMPT ===
+def _format_literal(text):
+    """Escape braces so static text isn't read as a template placeholder"""
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+@lru_cache(maxsize=1)
+def _sql_prompt_parts():
+    """
+    SQL generation prompt with the schema, banks and categories filled in once,
+    pre-split into (literal, placeholder) pairs so each call is a single join
+    of the literals and the per-query values.
+    """
+    return tuple(
+        (literal, field) for literal, field, _, _ in string.Formatter().parse(_sql_prompt_template())
+    )
+
+
+def _sql_prompt_template():
+    """Prompt text with {user_query}/{bank}/{category}/{product}/{product_like} placeholders"""
     # Get schema information
     schema_prompt = f"""
     Database Schema:
@@ -84,8 +427,8 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
     Table: products
     Columns:
     - product_id (INTEGER PRIMARY KEY)
-    - bank_name (TEXT) - Values: {', '.join(f"'{b}'" for b in SUPPORTED_BANKS)}
-    - category (TEXT) - e.g., {', '.join(f"'{c}'" for c in PRODUCT_CATEGORIES)}
+    - bank_name (TEXT) - Values: {_format_literal(', '.join(f"'{b}'" for b in SUPPORTED_BANKS))}
+    - category (TEXT) - e.g., {_format_literal(', '.join(f"'{c}'" for c in PRODUCT_CATEGORIES))}
     - product_name (TEXT) - Unique product identifier product
     - source_type (TEXT)
     - source_file (TEXT)
@@ -100,87 +443,26 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
     - Always limit results to avoid overwhelming output
     """
     
-    # Context from history
     history_context = ""
-    context_bank_filter = None
-    context_category_filter = None
-    context_product_name = None  # NEW: Track specific product mentions
     
-    if chat_history:
-        # FIX: Only extract context from USER messages, not bot responses
-        # This prevents auto-filtering when bot mentions a bank
-        user_messages = [msg for msg in chat_history[-5:] if msg.get('role') == 'user']
-        
-        # Also check the LAST bot response for product mentions
-        bot_messages = [msg for msg in chat_history[-2:] if msg.get('role') == 'assistant']
-        
-        for msg in user_messages:
-            msg_content = msg.get('content', '')
-            msg_lower = msg_content.lower()
-            
-            # Dynamic bank detection - only from user's queries
-            for bank in SUPPORTED_BANKS:
-                bank_lower = bank.lower()
-                if bank_lower in msg_lower:
-                    # Check if only this bank mentioned (not others)
-                    other_banks = [b for b in SUPPORTED_BANKS if b != bank]
-                    if not any(other_b.lower() in msg_lower for other_b in other_banks):
-                        context_bank_filter = bank
-                        break
-            
-            # Category detection
-            if 'credit card' in msg_lower:
-                context_category_filter = 'Credit Card'
-            elif 'debit card' in msg_lower:
-                context_category_filter = 'Debit Card'
-            elif 'loan' in msg_lower:
-                context_category_filter = 'Loan'
-            
-            # NEW: Product name extraction
-            # Look for common product name patterns
-            # E.g., "tell me about HDFC Regalia Gold"
-            if 'tell me about' in msg_lower or 'what is' in msg_lower or 'about the' in msg_lower:
-                # Extract everything after the trigger phrase
-                for trigger in ['tell me about ', 'what is ', 'about the ', 'about ']:
-                    if trigger in msg_lower:
-                        potential_product = msg_content[msg_lower.index(trigger) + len(trigger):].strip()
-                        # Clean up (remove trailing punctuation)
-                        potential_product = potential_product.rstrip('?.!,')
-                        if len(potential_product) > 3:  # Avoid short false positives
-                            context_product_name = potential_product
-                            break
-        
-        # Also check bot's last response for product name in the first sentence
-        if not context_product_name and bot_messages:
-            last_bot = bot_messages[-1].get('content', '')
-            # Look for patterns like "The HDFC Regalia Gold is..."
-            if ' is a ' in last_bot or ' is an ' in last_bot:
-                first_sentence = last_bot.split('.')[0]
-                if 'The ' in first_sentence:
-                    # Extract between "The " and " is"
-                    start = first_sentence.index('The ') + 4
-                    end = first_sentence.index(' is')
-                    if end > start:
-                        context_product_name = first_sentence[start:end].strip()
-
-
-    sql_generation_prompt = f"""
+    # Per-query values stay as {placeholders}; everything else is filled in here
+    return f"""
     {schema_prompt}
     
     {history_context}
     
-    User Question: "{user_query}"
+    User Question: "{{user_query}}"
     
     CONTEXT FILTERS (extracted from conversation history):
-    - Bank filter: {context_bank_filter if context_bank_filter else "None (search all banks)"}
-    - Category filter: {context_category_filter if context_category_filter else "None (search all categories)"}
-    - Product name filter: {context_product_name if context_product_name else "None"}
+    - Bank filter: {{bank}}
+    - Category filter: {{category}}
+    - Product name filter: {{product}}
     
     Generate a valid SQLite query to answer this question.
     
     CRITICAL - CONTEXT AWARENESS:
     - If a PRODUCT NAME is in context and the user asks a vague follow-up like "what are the fees", "eligibility", "features", etc., 
-      add a WHERE clause to filter by that specific product: `WHERE product_name LIKE '%{context_product_name if context_product_name else ""}%'`
+      add a WHERE clause to filter by that specific product: `WHERE product_name LIKE '%{{product_like}}%'`
     - If the user's question contains "all", "them", "those", "these" without specifying what, USE THE CONTEXT FILTERS ABOVE
     - Example: If context shows "Bank filter: SBI" and user says "give me all information", generate: 
       `SELECT * FROM products WHERE bank_name='SBI' AND category='Credit Card'`
@@ -201,8 +483,8 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
       * Example for cross-bank: `SELECT * FROM products WHERE (product_name LIKE '%Gold Loan%') AND bank_name IN ('SBI', 'HDFC')`
       * CRITICAL: Use separate LIKE clauses for EACH product name in the comparison
     
-    - If comparing categories across banks (e.g., "Compare {SUPPORTED_BANKS[0]} and {SUPPORTED_BANKS[1]} credit cards"):
-      * Example: `SELECT * FROM products WHERE category LIKE '%Credit Card%' AND bank_name IN ({get_bank_list_sql()})`
+    - If comparing categories across banks (e.g., "Compare {_format_literal(SUPPORTED_BANKS[0])} and {_format_literal(SUPPORTED_BANKS[1])} credit cards"):
+      * Example: `SELECT * FROM products WHERE category LIKE '%Credit Card%' AND bank_name IN ({_format_literal(get_bank_list_sql())})`
     
     RECOMMENDATION QUERIES:
     - If the user asks "best for students" or "best loan for students":
@@ -234,27 +516,211 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
     Return ONLY the SQL query, no explanations or markdown.
     If the query needs to extract from JSON attributes, use json_extract().
     """
+
+
+def _build_sql_generation_prompt(user_query, context_bank_filter, context_category_filter, context_product_name):
+    """Prompt asking the LLM for the SQLite query answering user_query"""
+    values = {
+        'user_query': user_query,
+        'bank': context_bank_filter if context_bank_filter else "None (search all banks)",
+        'category': context_category_filter if context_category_filter else "None (search all categories)",
+        'product': context_product_name if context_product_name else "None",
+        'product_like': context_product_name if context_product_name else "",
+    }
+    return "".join(literal + values[field] if field else literal for literal, field in _sql_prompt_parts())
+
+
+# Opening ```/```sql fence or closing ``` fence, stripped in one pass
+_SQL_FENCE_RE = re.compile(r'^```(?:sql)?\s*\n|\n```\s*$', re.IGNORECASE)
+
+
+def _clean_sql(text):
+    """Strip markdown code fences from an LLM SQL reply"""
+    return _SQL_FENCE_RE.sub('', text.strip()).strip()
+
+
+# === SQL CACHE WARM-UP (OpenAI Batch API) ===
+# Common questions are sent as one batch job (half the cost, up to 24h latency);
+# the generated SQL is loaded into the cache once the job completes
+def submit_sql_cache_warmup(questions: List[str]) -> str:
+    """Submit SQL generation for questions (no context filters) as a batch job; returns the batch id"""
+    lines = []
+    for i, question in enumerate(questions):
+        lines.append(json.dumps({
+            "custom_id": f"sql-{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": LLM_MODEL,
+                "temperature": 0.0,
+                "messages": [{"role": "user", "content": _build_sql_generation_prompt(question, None, None, None)}]
+            }
+        }))
     
-    # Generate SQL
-    try:
-        response = client.chat.completions.create(
-            messages=[{"role": "user", "content": sql_generation_prompt}],
-            model=LLM_MODEL,
-            temperature=0.0
-        )
+    input_file = client.files.create(
+        file=("sql_cache_warmup.jsonl", "\n".join(lines).encode('utf-8')),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logging.info(f"[SQL Tool] Submitted SQL cache warm-up batch {batch.id} ({len(questions)} questions)")
+    return batch.id
+
+
+def load_sql_cache_warmup(batch_id: str, questions: List[str]) -> Optional[int]:
+    """
+    Load a completed warm-up batch into the SQL cache.
+    questions must be the list passed to submit_sql_cache_warmup.
+    Returns the number of cached queries, or None if the batch isn't done yet.
+    """
+    batch = client.batches.retrieve(batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        logging.info(f"[SQL Tool] Warm-up batch {batch_id} is {batch.status}")
+        return None
+    
+    loaded = 0
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        try:
+            item = json.loads(line)
+            question = questions[int(item["custom_id"].split("-", 1)[1])]
+            sql_query = _clean_sql(item["response"]["body"]["choices"][0]["message"]["content"])
+            # Same rule as live queries: only SQL that compiles is cached
+            _get_db()._connection.execute(f"EXPLAIN {sql_query}")
+        except Exception as e:
+            logging.warning(f"[SQL Tool] Skipped warm-up result: {e}")
+            continue
+        _sql_cache_set(_sql_cache_key(question, None, None, None), sql_query)
+        loaded += 1
+    
+    logging.info(f"[SQL Tool] Loaded {loaded} warm-up queries into the SQL cache")
+    return loaded
+
+
+def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
+    """
+    Uses LLM to generate SQL query based on user question and history,
+    executes it against the products database.
+    
+    Args:
+        user_query: The user's question
+        chat_history: Conversation context for context-aware filtering
+        skip_synthesis: If True, skip GPT synthesis and return only data (saves ~1.5s)
+    
+    Returns:
+        dict: {
+            "text": "Natural language response..." (if skip_synthesis=False),
+            "data": [row_dict_1, ...], # List of dicts
+            "sql": "SELECT ...",
+            "source": "SQL Product Catalog"
+        }
+    """
+    
+    # Persona card recommendations come straight from the precomputed tables
+    if not skip_synthesis:
+        recommendation = _recommend_from_materialized_view(user_query.lower())
+        if recommendation:
+            return recommendation
+    
+    # The detail level only depends on the query, so classify it while the SQL is
+    # being generated/executed (not needed when synthesis is skipped)
+    detail_future = None if skip_synthesis else _executor.submit(classify_query_detail_level, user_query)
+    
+    # Context from history
+    context_bank_filter = None
+    context_category_filter = None
+    context_product_name = None  # NEW: Track specific product mentions
+    
+    if chat_history:
+        # FIX: Only extract context from USER messages, not bot responses
+        # This prevents auto-filtering when bot mentions a bank
+        # Newest message first: the latest mention of each filter wins, so the
+        # scan stops once all three are set
+        for msg in reversed(chat_history[-5:]):
+            if msg.get('role') != 'user':
+                continue
+            msg_content = msg.get('content', '')
+            msg_lower = msg_content.lower()
+            
+            # Dynamic bank detection - only from user's queries
+            # Only used when exactly one bank is mentioned (not others)
+            if context_bank_filter is None:
+                mentioned_banks = _banks_mentioned(msg_lower)
+                if len(mentioned_banks) == 1:
+                    context_bank_filter = mentioned_banks[0]
+            
+            # Category detection
+            if context_category_filter is None:
+                if 'credit card' in msg_lower:
+                    context_category_filter = 'Credit Card'
+                elif 'debit card' in msg_lower:
+                    context_category_filter = 'Debit Card'
+                elif 'loan' in msg_lower:
+                    context_category_filter = 'Loan'
+            
+            # NEW: Product name extraction
+            # Look for common product name patterns
+            # E.g., "tell me about HDFC Regalia Gold"
+            if context_product_name is None and (
+                'tell me about' in msg_lower or 'what is' in msg_lower or 'about the' in msg_lower
+            ):
+                # Extract everything after the trigger phrase
+                for trigger in ['tell me about ', 'what is ', 'about the ', 'about ']:
+                    if trigger in msg_lower:
+                        potential_product = msg_content[msg_lower.index(trigger) + len(trigger):].strip()
+                        # Clean up (remove trailing punctuation)
+                        potential_product = potential_product.rstrip('?.!,')
+                        if len(potential_product) > 3:  # Avoid short false positives
+                            context_product_name = potential_product
+                            break
+            
+            if context_bank_filter and context_category_filter and context_product_name:
+                break
         
-        sql_query = response.choices[0].message.content.strip()
+        # Also check the LAST bot response for product mentions
+        bot_messages = [msg for msg in chat_history[-2:] if msg.get('role') == 'assistant']
         
-        # Clean up the SQL (remove markdown code blocks if present)
-        sql_query = re.sub(r'^```sql\n', '', sql_query)
-        sql_query = re.sub(r'\n```$', '', sql_query)
-        sql_query = sql_query.strip()
+        # Also check bot's last response for product name in the first sentence
+        if not context_product_name and bot_messages:
+            last_bot = bot_messages[-1].get('content', '')
+            # Look for patterns like "The HDFC Regalia Gold is..."
+            if ' is a ' in last_bot or ' is an ' in last_bot:
+                first_sentence = last_bot.split('.')[0]
+                if 'The ' in first_sentence:
+                    # Extract between "The " and " is"
+                    start = first_sentence.index('The ') + 4
+                    end = first_sentence.index(' is')
+                    if end > start:
+                        context_product_name = first_sentence[start:end].strip()
+
+
+    # Generate SQL (or reuse the SQL generated for the same query + context filters)
+    try:
+        sql_cache_key = _sql_cache_key(user_query, context_bank_filter, context_category_filter, context_product_name)
+        sql_query = _sql_cache_get(sql_cache_key)
+        
+        if sql_query is None:
+            sql_generation_prompt = _build_sql_generation_prompt(
+                user_query, context_bank_filter, context_category_filter, context_product_name
+            )
+            with _llm_slots:
+                response = client.chat.completions.create(
+                    messages=[{"role": "user", "content": sql_generation_prompt}],
+                    model=LLM_MODEL,
+                    temperature=0.0
+                )
+            
+            sql_query = _clean_sql(response.choices[0].message.content)
+        else:
+            logging.info(f"[SQL Tool] SQL cache hit: {sql_query}")
         
         # Execute SQL using persistent connection
-        cursor = db._connection.cursor()
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description] if cursor.description else []
+        column_names, results = _rows_to_dicts(_get_db()._connection.execute(sql_query))
+        
+        # Only SQL that executed cleanly is reused
+        _sql_cache_set(sql_cache_key, sql_query)
         
         if not results:
             return {
@@ -267,31 +733,28 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
         # Quick Win 1: Skip synthesis if called from multi_retriever (saves ~1.5s)
         if skip_synthesis:
             return {
-                "data": [dict(zip(column_names, row)) for row in results],
+                "data": results,
                 "sql": sql_query,
                 "source": "Product Catalog (SQL)"
             }
         
-        # Format results as text
-        results_text = f"Query executed: {sql_query}\n\nResults ({len(results)} rows):\n"
-        for row in results[:20]:  # Limit display
-            row_dict = dict(zip(column_names, row))
-            results_text += f"\n{json.dumps(row_dict, indent=2)}\n"
+        # Single-value COUNT(...) SQL is answered directly - the detail level
+        # (possibly an LLM call still in flight) isn't needed
+        is_single_value = len(results) == 1 and len(column_names) == 1
+        if is_single_value and _COUNT_SQL_RE.search(sql_query):
+            return _count_response(sql_query, column_names[0], results[0][column_names[0]])
+        
+        # Rows shown to the synthesis prompt; the text itself is only built if a
+        # listing prompt is actually used
+        results_header = f"Query executed: {sql_query}\n\nResults ({len(results)} rows):\n"
+        display_rows = results[:20]  # Limit display
         
         # FIX: Classify query type BEFORE using it (was causing NameError)
-        detail_level = classify_query_detail_level(user_query)
+        detail_level = detail_future.result()
         
         # Handle COUNT queries properly - extract actual count value
-        is_count_query = 'COUNT(*' in sql_query.upper() or detail_level == 'COUNT_ONLY'
-        if is_count_query and len(results) == 1 and len(column_names) == 1:
-            actual_count = results[0][0]  # Extract the count value
-            count_response = f"{column_names[0].replace('COUNT(*)', 'Count').replace('_', ' ').title()}: {actual_count}"
-            return {
-                "text": count_response,
-                "data": [{column_names[0]: actual_count}],
-                "sql": sql_query,
-                "source": "Product Catalog (SQL)"
-            }
+        if detail_level == 'COUNT_ONLY' and is_single_value:
+            return _count_response(sql_query, column_names[0], results[0][column_names[0]])
         
         # FIX 4: Enhanced comparison detection
         is_comparison = any(word in user_query.lower() for word in ['compare', 'vs', 'versus', 'difference between', 'better than', ' vs. '])
@@ -309,6 +772,7 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
         )
         
         # FIX 2: Enhanced pre-filtering for recommendation queries
+        recommended_persona = None  # Persona whose filter narrowed the results, if any
         if is_recommendation and len(results) > 3:
             # Parse user intent
             query_lower = user_query.lower()
@@ -317,50 +781,49 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
             if 'home' in query_lower and 'loan' in query_lower:
                 # Filter for ONLY home loans
                 filtered_results = []
-                for row in results:
-                    row_dict = dict(zip(column_names, row))
+                for row_dict in results:
                     category = str(row_dict.get('category', '')).lower()
                     product_name = str(row_dict.get('product_name', '')).lower()
                     if 'home' in category or 'home' in product_name:
-                        filtered_results.append(row)
+                        filtered_results.append(row_dict)
                 
                 if filtered_results:
                     results = filtered_results[:10]  # Use home loans only
             else:
                 # Filter based on other personas
+                # The persona depends only on the query, so the row test is chosen once
+                persona = _recommendation_persona(query_lower)
+                
                 filtered_results = []
-                for row in results:
-                    row_dict = dict(zip(column_names, row))
-                    
-                    # Parse attributes JSON
-                    try:
-                        attrs = json.loads(row_dict.get('attributes', '{}'))
-                    except:
-                        attrs = {}
-                    
-                    # Extract fees as integer for comparison
-                    fees_str = attrs.get('fees', '') or row_dict.get('fees', '') or ''
-                    try:
-                        fees_num = int(''.join(filter(str.isdigit, str(fees_str).split('+')[0])))
-                    except:
-                        fees_num = 99999
-                    
-                    # Student filter: Low fees (< Rs. 1000)
-                    if 'student' in query_lower or 'students' in query_lower or 'low income' in query_lower:
-                        if fees_num <= 1000:
-                            filtered_results.append(row)
-                    
-                    # Traveler filter: Travel/Lounge keywords (FIXED)
-                    elif 'travel' in query_lower or 'fly' in query_lower or 'lounge' in query_lower or 'flyer' in query_lower:
-                        features = str(attrs.get('features', '')).lower()
-                        product_name = str(row_dict.get('product_name', '')).lower()
-                        if any(word in features or word in product_name for word in ['lounge', 'air india', 'travel', 'miles', 'vistara', 'etihad', 'indigo']):
-                            filtered_results.append(row)
-                    
-                    # Premium filter: High-end cards
-                    elif 'premium' in query_lower or 'luxury' in query_lower:
-                        if fees_num >= 2000:
-                            filtered_results.append(row)
+                if persona:
+                    for row_dict in results:
+                        # Traveler filter: Travel/Lounge keywords (FIXED)
+                        # feature_mask is precomputed at ingest; computed here only
+                        # when the generated SQL didn't select it
+                        if persona == 'travel':
+                            mask = row_dict.get('feature_mask')
+                            if mask is None:
+                                attrs = parse_attributes(row_dict.get('attributes', '{}'))
+                                mask = feature_mask(attrs.get('features', ''), row_dict.get('product_name', ''))
+                            if mask & TRAVEL_MASK:
+                                filtered_results.append(row_dict)
+                            continue
+                        
+                        attrs = parse_attributes(row_dict.get('attributes', '{}'))
+                        # Extract fees as integer for comparison
+                        fees_num = fee_number(attrs.get('fees', '') or row_dict.get('fees', '') or '')
+                        
+                        # Student filter: Low fees (< Rs. 1000)
+                        if persona == 'student':
+                            if fees_num <= 1000:
+                                filtered_results.append(row_dict)
+                        
+                        # Premium filter: High-end cards
+                        elif fees_num >= 2000:
+                            filtered_results.append(row_dict)
+                
+                if len(filtered_results) >= 2:
+                    recommended_persona = persona
             
             # If filtering worked, use filtered results
             if len(filtered_results) >= 2:
@@ -370,19 +833,36 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
                     "travel-focused" if any(w in query_lower for w in ['travel', 'fly', 'lounge']) else 
                     "premium" if 'premium' in query_lower else "filtered"
                 )
-                results_text = f"Pre-filtered to {len(results)} {filter_type} cards:\n"
-                for row in results:
-                    row_dict = dict(zip(column_names, row))
-                    results_text += f"\n{json.dumps(row_dict, indent=2)}\n"
+                results_header = f"Pre-filtered to {len(results)} {filter_type} cards:\n"
+                display_rows = results
         
         # Generate natural language response with adaptive prompts
         # CHECK RECOMMENDATIONS FIRST (most specific)
         query_lower = user_query.lower()
-        is_recommendation = (
-            'best' in query_lower and ('for' in query_lower or 'card' in query_lower or 'loan' in query_lower) or
-            'recommend' in query_lower or
-            'which bank' in query_lower
-        )
+        is_recommendation = _is_direct_recommendation(query_lower)
+        
+        # One short product row for a plain lookup: format it here instead of
+        # a synthesis round-trip
+        if (
+            not is_recommendation
+            and len(results) == 1
+            and detail_level not in ('COUNT_ONLY', 'EXPLAIN_DETAILED')
+            and 'product_name' in results[0]
+            and sum(len(str(v)) for v in results[0].values()) < SINGLE_ROW_MAX_CHARS
+        ):
+            return {
+                "text": _format_single_product(results[0]),
+                "data": results,
+                "sql": sql_query,
+                "source": "Product Catalog (SQL)"
+            }
+        
+        # Only the listing prompts include the rows, so the JSON dump is skipped otherwise
+        results_text = ""
+        if not is_recommendation and detail_level != 'COUNT_ONLY':
+            results_text = results_header + "".join(
+                f"\n{json.dumps(row_dict, indent=2)}\n" for row_dict in display_rows
+            )
         
         if is_recommendation:
             # Recommendation query - FORMAT DIRECTLY IN PYTHON (AI kept ignoring instructions)
@@ -390,8 +870,7 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
             # Sort by fees (lowest first) - PARSE JSON attributes
             def get_fee_num(row):
                 try:
-                    card = dict(zip(column_names, row))
-                    attrs = json.loads(card.get('attributes', '{}'))
+                    attrs = json.loads(row.get('attributes', '{}'))
                     fees_str = attrs.get('fees', '99999')
                     return int(''.join(filter(str.isdigit, fees_str.split('+')[0])))
                 except:
@@ -401,32 +880,11 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
             
             # Take top 3
             top_3 = sorted_results[:3]
-            
-            # Format response directly
-            response_text = f"**Best Credit Cards for Students:**\n\n"
-            
-            medals = ["🥇 **Best Choice**", "🥈 **Alternative**", "💰 **Budget Option**"]
-            for i, row in enumerate(top_3):
-                card = dict(zip(column_names, row))
-                
-                # Parse JSON attributes
-                try:
-                    attrs = json.loads(card.get('attributes', '{}'))
-                except:
-                    attrs = {}
-                
-                response_text += f"{medals[i]}: **{card.get('product_name', 'Unknown')}**\n"
-                response_text += f"- Bank: {card.get('bank_name', 'N/A')}\n"
-                response_text += f"- Fees: {attrs.get('fees', 'N/A')}\n"
-                response_text += f"- Features: {attrs.get('features', 'N/A')}\n"
-                response_text += f"- Eligibility: {attrs.get('eligibility', 'N/A')}\n\n"
-            
-            response_text += f"**Why these?** Lowest fees suitable for students (under Rs. 1000). "
-            response_text += f"We filtered {len(results)} cards and selected the top 3 by affordability."
+            response_text = _format_recommendation(top_3, len(results), recommended_persona)
             
             return {
                 "text": response_text,
-                "data": [dict(zip(column_names, row)) for row in top_3],
+                "data": top_3,
                 "sql": sql_query,
                 "source": "Product Catalog (SQL)"
             }
@@ -483,15 +941,16 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
             - Format as a clean list
             """
         
-        final_response = client.chat.completions.create(
-            messages=[{"role": "user", "content": synthesis_prompt}],
-            model=LLM_MODEL,
-            temperature=0.3
-        )
+        with _llm_slots:
+            final_response = client.chat.completions.create(
+                messages=[{"role": "user", "content": synthesis_prompt}],
+                model=LLM_MODEL,
+                temperature=0.3
+            )
         
         return {
             "text": final_response.choices[0].message.content,
-            "data": [dict(zip(column_names, row)) for row in results],
+            "data": results,
             "sql": sql_query,
             "source": "Product Catalog (SQL)"
         }
@@ -502,6 +961,11 @@ def execute_sql_tool(user_query, chat_history=None, skip_synthesis=False):
             "data": None,
             "source": "Error"
         }
+    finally:
+        # Every early return (COUNT fast path, no rows, errors) leaves the classification
+        # unused; drop it if it hasn't started so it doesn't hold an executor slot
+        if detail_future is not None:
+            detail_future.cancel()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,79 @@
 import chromadb
 from chromadb.utils import embedding_functions
 import os
-import uuid
-from src.config import CHROMADB_DIR, EMBEDDING_MODEL, CHROMA_COLLECTION_NAME
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from src.config import CHROMADB_DIR, EMBEDDING_MODEL, EMBEDDING_BACKEND, CHROMA_COLLECTION_NAME
+
+
+class QuantizedONNXMiniLM(embedding_functions.ONNXMiniLM_L6_V2):
+    """
+    Chroma's onnxruntime all-MiniLM-L6-v2 with int8 dynamically-quantized weights.
+    Tokenization, mean pooling and normalization are inherited; only the session
+    is swapped. The quantized model is written next to Chroma's download once.
+    """
+    
+    @cached_property
+    def model(self):
+        import onnxruntime as ort
+        
+        model_dir = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME)
+        int8_path = os.path.join(model_dir, "model.int8.onnx")
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            
+            logging.info(f"[VectorDB] Quantizing {EMBEDDING_MODEL} to int8: {int8_path}")
+            quantize_dynamic(os.path.join(model_dir, "model.onnx"), int8_path, weight_type=QuantType.QInt8)
+        
+        return ort.InferenceSession(int8_path, providers=["CPUExecutionProvider"])
+
+
+@lru_cache(maxsize=1)
+def make_embedding_function():
+    """
+    Build the embedding function for FAQ documents and queries.
+    Cached: every FAQVectorDB shares one loaded model.
+    
+    EMBEDDING_BACKEND=onnx uses Chroma's onnxruntime build of all-MiniLM-L6-v2
+    (no PyTorch in the query path), onnx-int8 the same model with int8 weights;
+    anything else, or any failure, falls back to sentence-transformers.
+    Switching backends changes the vectors slightly, so re-ingest FAQs after.
+    """
+    if EMBEDDING_BACKEND == "onnx-int8" and EMBEDDING_MODEL == "all-MiniLM-L6-v2":
+        try:
+            embedding_fn = QuantizedONNXMiniLM(preferred_providers=["CPUExecutionProvider"])
+            embedding_fn(["warm-up"])  # Download + quantize now rather than on the first query
+            return embedding_fn
+        except Exception as e:
+            logging.warning(f"[VectorDB] int8 ONNX embedding backend unavailable ({e}), using sentence-transformers")
+    elif EMBEDDING_BACKEND == "onnx" and EMBEDDING_MODEL == "all-MiniLM-L6-v2":
+        try:
+            return embedding_functions.ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+        except Exception as e:
+            logging.warning(f"[VectorDB] ONNX embedding backend unavailable ({e}), using sentence-transformers")
+    return embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+
+
+# Repeated / near-identical queries reuse earlier results instead of hitting Chroma
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_SIMILARITY = 0.97
+# Entries expire so a separate ingestion run is picked up without a restart
+QUERY_CACHE_TTL_SECONDS = 300
+# Query text -> embedding; independent of the collection, so never expires
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+
+def faq_doc_id(faq):
+    """Stable document ID from the FAQ's bank, category, question and answer"""
+    key = "\x1f".join(
+        str(faq.get(field, "")) for field in ("bank_name", "category", "question", "answer")
+    )
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
 
 class FAQVectorDB:
     def __init__(self):
@@ -11,15 +82,128 @@ class FAQVectorDB:
         
         self.client = chromadb.PersistentClient(path=str(CHROMADB_DIR))
         
-        # Use sentence-transformers for better quality embeddings
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=EMBEDDING_MODEL
-        )
+        # sentence-transformers by default; onnxruntime MiniLM if EMBEDDING_BACKEND=onnx
+        self.embedding_fn = make_embedding_function()
         
         self.collection = self.client.get_or_create_collection(
             name=CHROMA_COLLECTION_NAME,
             embedding_function=self.embedding_fn
         )
+        
+        # Query cache: exact text -> results (LRU), plus a matrix of recent
+        # normalized query embeddings for the cosine-similarity lookup
+        self._cache_lock = threading.Lock()
+        self._exact_cache = OrderedDict()  # (query, bank_filter, n_results) -> (expires_at, hits)
+        self._recent_q_emb = None  # np.ndarray (N, d)
+        self._recent_keys = []     # (bank_filter, n_results) per row
+        self._recent_results = []
+        self._recent_expires = []
+        self._cache_stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0}
+        self._query_vectors = OrderedDict()  # normalized query text -> float32 embedding
+
+    def clear_query_cache(self):
+        """Drop cached query results (the collection changed)"""
+        with self._cache_lock:
+            self._exact_cache.clear()
+            self._recent_q_emb = None
+            self._recent_keys = []
+            self._recent_results = []
+            self._recent_expires = []
+
+    def get_cache_stats(self):
+        """Query cache counters and hit rate since startup"""
+        with self._cache_lock:
+            stats = dict(self._cache_stats)
+            stats['size'] = len(self._exact_cache)
+        lookups = stats['exact_hits'] + stats['semantic_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['exact_hits'] + stats['semantic_hits']) / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _cache_key(query, bank_filter, n_results):
+        """Whitespace/case-insensitive key (the embedding model is uncased)"""
+        return (' '.join(query.lower().split()), bank_filter or None, n_results)
+
+    def embed_queries(self, queries):
+        """
+        Embed queries in one batched model call and remember the vectors, so later
+        query_faqs / batch_query_faqs calls for the same text skip the model.
+        Useful to precompute a known query set (e.g. a test run) up front.
+        
+        Returns the float32 vectors in input order.
+        """
+        keys = [' '.join(query.lower().split()) for query in queries]
+        known = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._query_vectors:
+                    self._query_vectors.move_to_end(key)
+                    known[key] = self._query_vectors[key]
+        missing = {key: query for key, query in zip(keys, queries) if key not in known}
+        if missing:
+            embedded = self.embedding_fn(list(missing.values()))
+            with self._cache_lock:
+                for key, vec in zip(missing, embedded):
+                    known[key] = self._query_vectors[key] = self._as_vector(vec)
+                while len(self._query_vectors) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_vectors.popitem(last=False)
+        return [known[key] for key in keys]
+
+    def _exact_lookup(self, key):
+        """Unexpired exact-cache hits for key (None on miss); caller holds the lock"""
+        entry = self._exact_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, hits = entry
+        if expires_at < time.monotonic():
+            del self._exact_cache[key]
+            return None
+        self._exact_cache.move_to_end(key)
+        self._cache_stats['exact_hits'] += 1
+        return hits
+
+    def _semantic_lookup(self, q, params):
+        """Results of a cached query with the same params and cosine >= threshold"""
+        with self._cache_lock:
+            if self._recent_q_emb is None:
+                self._cache_stats['misses'] += 1
+                return None
+            sims = self._recent_q_emb @ q
+            now = time.monotonic()
+            best, best_sim = None, QUERY_CACHE_SIMILARITY
+            for i, key in enumerate(self._recent_keys):
+                if key == params and sims[i] >= best_sim and self._recent_expires[i] >= now:
+                    best, best_sim = i, sims[i]
+            if best is None:
+                self._cache_stats['misses'] += 1
+                return None
+            self._cache_stats['semantic_hits'] += 1
+            return self._recent_results[best]
+
+    def _cache_store(self, exact_key, q, params, results):
+        import numpy as np
+        
+        expires_at = time.monotonic() + QUERY_CACHE_TTL_SECONDS
+        with self._cache_lock:
+            self._exact_cache[exact_key] = (expires_at, results)
+            if len(self._exact_cache) > QUERY_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
+            
+            row = q.reshape(1, -1)
+            if self._recent_q_emb is None:
+                self._recent_q_emb = row
+            else:
+                self._recent_q_emb = np.vstack([self._recent_q_emb, row])
+            self._recent_keys.append(params)
+            self._recent_results.append(results)
+            self._recent_expires.append(expires_at)
+            
+            # FIFO eviction
+            if len(self._recent_keys) > QUERY_CACHE_SIZE:
+                self._recent_q_emb = self._recent_q_emb[1:]
+                self._recent_keys.pop(0)
+                self._recent_results.pop(0)
+                self._recent_expires.pop(0)
 
     def upsert_faqs(self, faqs_list):
         """
@@ -40,10 +224,14 @@ class FAQVectorDB:
         ids = []
         documents = []
         metadatas = []
+        seen_ids = set()
         
         for faq in faqs_list:
-            # unique ID
-            doc_id = str(uuid.uuid4())
+            # Content-derived ID: re-ingesting the same FAQ maps to the same document
+            doc_id = faq_doc_id(faq)
+            if doc_id in seen_ids:
+                continue
+            seen_ids.add(doc_id)
             ids.append(doc_id)
             
             # Content to embed: Question + Answer for full context
@@ -71,16 +259,36 @@ class FAQVectorDB:
             
             metadatas.append(metadata)
             
-        # Upsert in batches to avoid hitting limits
+        # Unchanged FAQs are already stored - skip them before embedding
         batch_size = 100
+        existing = set()
+        for i in range(0, len(ids), batch_size):
+            existing.update(self.collection.get(ids=ids[i:i + batch_size], include=[])['ids'])
+        if existing:
+            keep = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+            ids = [ids[i] for i in keep]
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+            print(f"   -> Skipped {len(existing)} unchanged FAQs")
+            if not ids:
+                return
+        
+        # Embed all documents in one call so the model runs full batches,
+        # rather than the collection embedding each upsert batch separately
+        embeddings = self.embedding_fn(documents)
+        
+        # Upsert in batches to avoid hitting limits
         for i in range(0, len(ids), batch_size):
             end = min(i + batch_size, len(ids))
             self.collection.upsert(
                 ids=ids[i:end],
                 documents=documents[i:end],
+                embeddings=embeddings[i:end],
                 metadatas=metadatas[i:end]
             )
             print(f"   -> Upserted batch {i} to {end}")
+        
+        self.clear_query_cache()
 
     def query_faqs(self, user_query, bank_filter=None, n_results=3, include_distances=False):
         """
@@ -100,32 +308,121 @@ class FAQVectorDB:
         if not bank_filter:
             where_clause = None
 
+        # Distances are always fetched, so cached hits serve either include_distances
+        exact_key = self._cache_key(user_query, bank_filter, n_results)
+        params = exact_key[1:]
+        with self._cache_lock:
+            cached = self._exact_lookup(exact_key)
+        if cached is not None:
+            return self._faq_results(cached, include_distances)
+        
+        # Embed once: used for both the semantic lookup and the Chroma query
+        q = self.embed_queries([user_query])[0]
+        q_unit = self._unit(q)
+        
+        cached = self._semantic_lookup(q_unit, params)
+        if cached is not None:
+            logging.info(f"[VectorDB] Semantic cache hit for: {user_query}")
+            return self._faq_results(cached, include_distances)
+
         results = self.collection.query(
-            query_texts=[user_query],
+            query_embeddings=[q.tolist()],
             n_results=n_results,
             where=where_clause,
-            include=['metadatas', 'distances'] if include_distances else ['metadatas']
+            include=['metadatas', 'distances']
         )
         
-        # Parse results
-        parsed_results = []
+        # (metadata, distance) per hit
+        hits = []
         if results['metadatas'] and len(results['metadatas']) > 0:
-            for i, meta in enumerate(results['metadatas'][0]):
-                result_item = dict(meta)  # Copy metadata
-                # Add distance/similarity if requested
-                if include_distances and results.get('distances') and len(results['distances']) > 0:
-                    # ChromaDB returns L2 distance - lower is more similar
-                    # Convert to similarity: 1 / (1 + distance)
-                    distance = results['distances'][0][i]
-                    result_item['distance'] = distance
-                    result_item['similarity'] = 1 / (1 + distance)
-                parsed_results.append(result_item)
-                
-        return parsed_results
+            hits = list(zip(results['metadatas'][0], results['distances'][0]))
+        
+        self._cache_store(exact_key, q_unit, params, hits)
+        return self._faq_results(hits, include_distances)
+
+    def batch_query_faqs(self, queries, bank_filters, n_results=3, include_distances=False):
+        """
+        query_faqs for several (query, bank_filter) pairs at once.
+        
+        Uncached queries are embedded in a single model call (each distinct
+        text once), and each distinct bank filter runs one Chroma search
+        over all of its query vectors.
+        
+        Returns one result list per pair, in input order.
+        """
+        pairs = [(query, bank_filter or None) for query, bank_filter in zip(queries, bank_filters)]
+        hits_by_key = {}
+        misses = []
+        with self._cache_lock:
+            for query, bank_filter in pairs:
+                key = self._cache_key(query, bank_filter, n_results)
+                if key in hits_by_key or key in misses:
+                    continue
+                cached = self._exact_lookup(key)
+                if cached is not None:
+                    hits_by_key[key] = cached
+                else:
+                    misses.append(key)
+        
+        if misses:
+            texts = list(dict.fromkeys(query for query, _, _ in misses))
+            vectors = dict(zip(texts, self.embed_queries(texts)))
+            
+            to_search = {}  # bank_filter -> keys still needing a Chroma search
+            for key in misses:
+                cached = self._semantic_lookup(self._unit(vectors[key[0]]), key[1:])
+                if cached is not None:
+                    hits_by_key[key] = cached
+                else:
+                    to_search.setdefault(key[1], []).append(key)
+            
+            for bank_filter, keys in to_search.items():
+                results = self.collection.query(
+                    query_embeddings=[vectors[key[0]].tolist() for key in keys],
+                    n_results=n_results,
+                    where={"bank_name": bank_filter} if bank_filter else None,
+                    include=['metadatas', 'distances']
+                )
+                for i, key in enumerate(keys):
+                    hits = []
+                    if results['metadatas'] and len(results['metadatas']) > i:
+                        hits = list(zip(results['metadatas'][i], results['distances'][i]))
+                    self._cache_store(key, self._unit(vectors[key[0]]), key[1:], hits)
+                    hits_by_key[key] = hits
+        
+        return [
+            self._faq_results(hits_by_key[self._cache_key(query, bank_filter, n_results)], include_distances)
+            for query, bank_filter in pairs
+        ]
+
+    @staticmethod
+    def _as_vector(embedding):
+        import numpy as np
+        return np.asarray(embedding, dtype=np.float32)
+
+    @staticmethod
+    def _unit(q):
+        """q scaled to unit length (for cosine similarity)"""
+        import numpy as np
+        norm = np.linalg.norm(q)
+        return q / norm if norm else q
+
+    @staticmethod
+    def _faq_results(hits, include_distances):
+        """Result dicts (fresh copies of the metadata) from (metadata, distance) hits"""
+        if not include_distances:
+            return [dict(meta) for meta, _ in hits]
+        # ChromaDB returns L2 distance - lower is more similar
+        # Convert to similarity: 1 / (1 + distance)
+        return [
+            {**meta, 'distance': distance, 'similarity': 1 / (1 + distance)}
+            for meta, distance in hits
+        ]
 
     def reset_collection(self):
         """Clears the collection - useful for re-ingestion"""
         self.client.delete_collection(CHROMA_COLLECTION_NAME)
+        self.clear_query_cache()
         self.collection = self.client.get_or_create_collection(
             name=CHROMA_COLLECTION_NAME,
             embedding_function=self.embedding_fn